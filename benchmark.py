@@ -0,0 +1,270 @@
+"""
+Benchmarks SiteScraper.scrape_all against a local stand-in for getProviderDemandData.
+
+Example:
+    python benchmark.py --sites 300 --days 14 --blocks 40 --latency 0.08 --concurrency 5,15,30
+
+With --startup it instead times how long each CLI command takes to start, in fresh
+interpreters, and which heavy modules it loads:
+    python benchmark.py --startup --repeats 10
+"""
+import os
+import sys
+import json
+import time
+import random
+import asyncio
+import logging
+import argparse
+import tempfile
+import subprocess
+import multiprocessing
+
+from aiohttp import web
+
+logger = logging.getLogger(__name__)
+
+
+def percentile(values, pct):
+    """Nearest-rank percentile of a list of numbers."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, int(round(pct / 100 * len(ordered))) - 1))]
+
+
+def peak_rss_mb():
+    """Peak resident set size of this process in MB, if the platform reports it."""
+    try:
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak / 1024 / 1024 if sys.platform == "darwin" else peak / 1024
+    except ImportError:
+        try:
+            import psutil
+            return psutil.Process().memory_info().peak_wset / 1024 / 1024
+        except (ImportError, AttributeError):
+            return None
+
+
+class DemandStandIn:
+    """
+    Local aiohttp stand-in for the demand API.
+
+    Args:
+        blocks: Demand blocks returned per date.
+        latency: Mean added latency per request in seconds (exponentially distributed).
+        error_rate: Share of requests answered with 503.
+        throttle_rate: Share of requests answered with 429.
+        max_connections: Requests served at once; the rest queue like an overloaded backend.
+    """
+
+    def __init__(self, blocks=40, latency=0.05, error_rate=0.0, throttle_rate=0.0, max_connections=50):
+        self.blocks = blocks
+        self.latency = latency
+        self.error_rate = error_rate
+        self.throttle_rate = throttle_rate
+        self.limit = asyncio.Semaphore(max_connections)
+        self.bodies = {}
+        self.bytes_sent = 0
+        self.requests = 0
+        self.runner = None
+        self.port = None
+
+    def body(self, dates):
+        """Response body for a date window, built once per window."""
+        key = tuple(dates)
+        if key not in self.bodies:
+            capacity_types = ["CSP", "CSP", "AMZL", "DSP"]
+            self.bodies[key] = json.dumps({
+                date: [
+                    {
+                        "capacityType": capacity_types[i % len(capacity_types)],
+                        "startTime": 1735725600000 + i * 900000,
+                        "durationInMinutes": 60 * (1 + i % 4),
+                        "requiredQuantity": 10 + i % 7,
+                        "scheduledQuantity": 5 + i % 5,
+                        "waveGroupId": f"W{i % 6}",
+                        "serviceTypeId": f"st-{i % 3}",
+                    }
+                    for i in range(self.blocks)
+                ]
+                for date in dates
+            }).encode()
+        return self.bodies[key]
+
+    async def handle(self, request):
+        self.requests += 1
+        async with self.limit:
+            if self.latency:
+                await asyncio.sleep(random.expovariate(1 / self.latency))
+
+            roll = random.random()
+            if roll < self.throttle_rate:
+                return web.Response(status=429, headers={"Retry-After": "0.2"})
+            if roll < self.throttle_rate + self.error_rate:
+                return web.Response(status=503)
+
+            body = self.body(json.loads(request.query["dates"]))
+            self.bytes_sent += len(body)
+            return web.Response(body=body, content_type="application/json")
+
+    async def start(self, port=0):
+        app = web.Application()
+        app.router.add_get("/getProviderDemandData", self.handle)
+        self.runner = web.AppRunner(app, access_log=None)
+        await self.runner.setup()
+        site = web.TCPSite(self.runner, "127.0.0.1", port)
+        await site.start()
+        self.port = site._server.sockets[0].getsockname()[1]
+        return f"http://127.0.0.1:{self.port}/getProviderDemandData"
+
+    async def stop(self):
+        await self.runner.cleanup()
+
+
+def run_client(url, num_sites, num_days, concurrency, results):
+    """Runs one scrape in a fresh process so its peak RSS is measured on its own."""
+    logging.basicConfig(level=logging.WARNING, force=True)
+    from site_scrape import SiteScraper
+    from writer import DemandWriter
+
+    latencies = []
+
+    class TimedScraper(SiteScraper):
+        async def fetch_site_data(self, session, site, dates):
+            start = time.perf_counter()
+            try:
+                return await super().fetch_site_data(session, site, dates)
+            finally:
+                latencies.append(time.perf_counter() - start)
+
+    async def scrape():
+        scraper = TimedScraper(url, num_days=num_days)
+        sites = [{"station": f"D{i:04d}", "area_id": f"area-{i}"} for i in range(num_sites)]
+        with tempfile.TemporaryDirectory() as tmp:
+            with DemandWriter(os.path.join(tmp, "bench.parquet")) as writer:
+                start = time.perf_counter()
+                scraped = await scraper.scrape_all(sites, "session=benchmark", max_concurrent=concurrency, writer=writer)
+                elapsed = time.perf_counter() - start
+        return scraped, elapsed, writer.rows, scraper.stats
+
+    scraped, elapsed, rows, stats = asyncio.run(scrape())
+    results.put({
+        "concurrency": concurrency,
+        "sites": scraped,
+        "seconds": elapsed,
+        "sites_per_sec": scraped / elapsed if elapsed else 0.0,
+        "p50_ms": percentile(latencies, 50) * 1000,
+        "p95_ms": percentile(latencies, 95) * 1000,
+        "p99_ms": percentile(latencies, 99) * 1000,
+        "peak_rss_mb": peak_rss_mb(),
+        "rows": rows,
+        "lost": stats.get("lost", 0),
+        "retries": stats.get("retries", 0),
+    })
+
+
+def run_isolated(url, num_sites, num_days, concurrency):
+    ctx = multiprocessing.get_context("spawn")
+    results = ctx.Queue()
+    process = ctx.Process(target=run_client, args=(url, num_sites, num_days, concurrency, results))
+    process.start()
+    result = results.get()
+    process.join()
+    return result
+
+
+async def benchmark(args):
+    stand_in = DemandStandIn(
+        blocks=args.blocks,
+        latency=args.latency,
+        error_rate=args.error_rate,
+        throttle_rate=args.throttle_rate,
+        max_connections=args.max_connections
+    )
+    url = await stand_in.start(args.port)
+    loop = asyncio.get_running_loop()
+    rows = []
+    try:
+        for concurrency in args.concurrency:
+            sent_before = stand_in.bytes_sent
+            result = await loop.run_in_executor(None, run_isolated, url, args.sites, args.days, concurrency)
+            result["mb_parsed"] = (stand_in.bytes_sent - sent_before) / 1024 / 1024
+            rows.append(result)
+            print(
+                f"concurrency={concurrency:>3}  {result['sites_per_sec']:7.1f} sites/s  "
+                f"p50={result['p50_ms']:7.1f}ms  p95={result['p95_ms']:7.1f}ms  p99={result['p99_ms']:7.1f}ms  "
+                f"peak_rss={result['peak_rss_mb'] or 0:6.1f}MB  parsed={result['mb_parsed']:7.1f}MB  "
+                f"lost={result['lost']} retries={result['retries']}"
+            )
+    finally:
+        await stand_in.stop()
+    return rows
+
+
+# Modules each CLI command imports before its first request, including the lazy imports
+# its default path always reaches
+STARTUP_TARGETS = {
+    "python": [],
+    "cli": ["cli"],
+    "status": ["cli", "cookie_scrape", "status_index", "upload_status", "requests"],
+    "status --wait": ["cli", "cookie_scrape", "status_index", "upload_status"],
+    "cookies": ["cli", "cookie_scrape"],
+    "scrape": ["cli", "site_scrape", "history"],  # KEEP_HISTORY is on by default
+    "upload": ["cli", "uploader", "selenium.webdriver"],  # UPLOAD_MODE defaults to the browser
+}
+HEAVY_MODULES = ["selenium", "pandas", "boto3", "requests", "pyarrow", "aiohttp"]
+
+
+def startup(repeats=5):
+    """
+    Times a fresh interpreter importing what each CLI command needs.
+
+    Reports the median wall time including interpreter startup, and the heavy modules
+    that ended up loaded.
+    """
+    here = os.path.dirname(os.path.abspath(__file__))
+    rows = []
+    for name, modules in STARTUP_TARGETS.items():
+        code = "import sys\n" + "".join(f"import {module}\n" for module in modules) + (
+            f"print(','.join(m for m in {HEAVY_MODULES!r} if m in sys.modules))"
+        )
+        timings, loaded = [], ""
+        for _ in range(repeats):
+            start = time.perf_counter()
+            result = subprocess.run([sys.executable, "-c", code], cwd=here, capture_output=True, text=True)
+            timings.append((time.perf_counter() - start) * 1000)
+            if result.returncode != 0:
+                raise RuntimeError(f"{name} failed to import: {result.stderr.strip().splitlines()[-1]}")
+            loaded = result.stdout.strip()
+
+        row = {"command": name, "median_ms": percentile(timings, 50), "min_ms": min(timings), "loads": loaded}
+        rows.append(row)
+        print(f"{name:>13}  median={row['median_ms']:7.1f}ms  min={row['min_ms']:7.1f}ms  loads={loaded or '-'}")
+    return rows
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sites", type=int, default=200)
+    parser.add_argument("--days", type=int, default=7)
+    parser.add_argument("--blocks", type=int, default=40, help="demand blocks per date")
+    parser.add_argument("--latency", type=float, default=0.05, help="mean added seconds per request")
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--throttle-rate", type=float, default=0.0)
+    parser.add_argument("--max-connections", type=int, default=50, help="requests the stand-in serves at once")
+    parser.add_argument("--concurrency", type=lambda v: [int(c) for c in v.split(",")], default=[5, 15, 30])
+    parser.add_argument("--port", type=int, default=0)
+    parser.add_argument("--json", help="also write the results to this file")
+    parser.add_argument("--startup", action="store_true", help="time CLI startup instead of scraping")
+    parser.add_argument("--repeats", type=int, default=5, help="interpreter launches per command with --startup")
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    results = startup(args.repeats) if args.startup else asyncio.run(benchmark(args))
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
@@ -0,0 +1,214 @@
+"""
+Single entry point for scraping, uploading, status checks and cookie management.
+
+Only the modules a command needs are imported, and only once it runs, so quick
+commands such as status never load selenium, pandas or pyarrow.
+
+Example:
+    python cli.py scrape --workers 4
+    python cli.py scrape --resume
+    python cli.py export --upload --type Demand
+    python cli.py pipeline --type Demand
+    python cli.py fill --date 2025-01-20
+    python cli.py upload --type Demand file_1.csv file_2.csv
+    python cli.py status --type Demand file_1.csv --wait
+    python cli.py status --failures 60
+    python cli.py cookies --check
+"""
+import sys
+import json
+import asyncio
+import argparse
+
+from config import *
+
+
+def cmd_scrape(args):
+    site_filters = {"prefix": args.prefix}
+    if args.daemon:
+        from daemon import ScrapeDaemon
+        asyncio.run(ScrapeDaemon(output=args.output, site_filters=site_filters).run())
+    elif args.workers > 1:
+        from shard import run_local
+        run_local(args.workers, args.output, site_filters, resume=args.resume)
+    else:
+        from site_scrape import main
+        asyncio.run(main(output=args.output, site_filters=site_filters, resume=args.resume))
+
+
+def cmd_export(args):
+    from export import check_uploadable, export_uploads, upload_parts
+
+    if args.upload:
+        if not args.type:
+            raise SystemExit("export --upload needs an explicit --type")
+        try:
+            check_uploadable(args.type)
+        except ValueError as e:
+            raise SystemExit(str(e))
+
+    parts = export_uploads(args.source, args.type, args.out_dir, args.max_bytes)
+    if not args.upload:
+        for upload_type, path in parts:
+            print(json.dumps({"type": upload_type, "file": path}))
+        return 0
+
+    from metrics import METRICS
+    try:
+        results = upload_parts(parts, timeout=args.timeout)
+    finally:
+        METRICS.write(METRICS_PATH)
+    for result in results:
+        print(json.dumps(result, default=str))
+    return 0 if all(result["success"] for result in results) else 1
+
+
+def cmd_pipeline(args):
+    from pipeline import Pipeline
+
+    try:
+        pipeline = Pipeline(upload_types=args.type, output=args.output)
+    except ValueError as e:
+        raise SystemExit(str(e))
+    results = asyncio.run(pipeline.run(pipeline.scraper.get_sites(prefix=args.prefix)))
+    for result in results:
+        print(json.dumps(result, default=str))
+    return 0 if all(result["success"] for result in results) else 1
+
+
+def cmd_fill(args):
+    from fill_report import main
+
+    paths = asyncio.run(main(date=args.date, site_filters={"prefix": args.prefix}, out_dir=args.out_dir))
+    for path in paths:
+        print(path)
+
+
+def cmd_upload(args):
+    from uploader import upload_files
+    from metrics import METRICS
+
+    try:
+        results = upload_files([(args.type, path) for path in args.files], mode=args.mode)
+    finally:
+        METRICS.write(METRICS_PATH)
+    return 0 if all(result["success"] for result in results) else 1
+
+
+def cmd_status(args):
+    from cookie_scrape import Cookies
+    from status_index import StatusIndex
+    from upload_status import refresh_status_index, wait_for_statuses
+    from metrics import METRICS
+
+    if args.failures is None and not (args.type and args.files):
+        raise SystemExit("status needs --type and files, or --failures")
+
+    try:
+        jar = Cookies(STATUS_URL).get_jar()
+        if args.wait and args.failures is None:
+            files = [(args.type, os.path.basename(path)) for path in args.files]
+            records = asyncio.run(wait_for_statuses(files, jar, timeout=args.timeout))
+        else:
+            # One incremental refresh, then every lookup is answered from the local index
+            with StatusIndex(STATUS_INDEX_PATH) as index:
+                if refresh_status_index(index, STATUS_URL, jar, args.type) is None:
+                    return 1
+                if args.failures is not None:
+                    since = datetime.fromtimestamp(datetime.now().timestamp() - args.failures * 60)
+                    for record in index.failures(since=since, upload_type=args.type):
+                        print(json.dumps(record, default=str))
+                    return 0
+                records = [index.latest(args.type, os.path.basename(path)) for path in args.files]
+    finally:
+        METRICS.write(METRICS_PATH)
+
+    for path, record in zip(args.files, records):
+        print(json.dumps({"file": path, "record": record}, default=str))
+    return 0
+
+
+def cmd_cookies(args):
+    from cookie_scrape import Cookies, CookieJar
+
+    if args.refresh:
+        return 0 if Cookies(SUI_URL).scrape_and_save(SUI_URL) else 1
+    if args.check:
+        jar = CookieJar.shared(cookies_path()).load()
+        expiries = [cookie["expiry"] for cookie in jar.as_list() if "expiry" in cookie]
+        print(json.dumps({
+            "path": jar.path,
+            "cookies": len(jar.as_list()),
+            "valid": bool(jar.as_list()) and jar.is_valid(),
+            "expires": datetime.fromtimestamp(min(expiries)).isoformat() if expiries else None,
+        }))
+        return 0 if jar.as_list() and jar.is_valid() else 1
+
+    # Same as cookie_scrape.py: validate and log in again if needed
+    return 0 if Cookies(SUI_URL).get_jar().as_list() else 1
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    scrape = commands.add_parser("scrape", help="Scrape provider demand for the managed sites")
+    scrape.add_argument("--output", default=SAVE_PATH)
+    scrape.add_argument("--prefix", default="D", help="Station prefix filter")
+    scrape.add_argument("--workers", type=int, default=1, help="Shard the sites across this many processes")
+    scrape.add_argument("--daemon", action="store_true", help="Keep running and re-scrape every DAEMON_INTERVAL")
+    scrape.add_argument("--resume", action="store_true", help="Finish today's interrupted run instead of starting over")
+    scrape.set_defaults(func=cmd_scrape)
+
+    export = commands.add_parser("export", help="Build upload files from scraped data, optionally uploading them")
+    export.add_argument("--source", default=SAVE_PATH, help="Scraped CSV or Parquet output")
+    export.add_argument("--type", action="append", choices=list(EXPORT_LAYOUTS), help="Upload type, repeatable")
+    export.add_argument("--out-dir", default=EXPORT_DIR)
+    export.add_argument("--max-bytes", type=int, default=EXPORT_MAX_BYTES, help="Largest upload file part")
+    export.add_argument("--upload", action="store_true",
+                        help="Upload the parts of confirmed layouts (needs --type) and wait for processing")
+    export.add_argument("--timeout", type=float, default=300)
+    export.set_defaults(func=cmd_export)
+
+    pipeline = commands.add_parser("pipeline", help="Scrape, build, upload and verify upload files in one pipeline")
+    pipeline.add_argument("--type", action="append", choices=list(EXPORT_LAYOUTS), required=True,
+                          help="Upload type, repeatable; its layout must be in CONFIRMED_EXPORT_LAYOUTS")
+    pipeline.add_argument("--output", help="Also write the scraped demand here")
+    pipeline.add_argument("--prefix", default="D", help="Station prefix filter")
+    pipeline.set_defaults(func=cmd_pipeline)
+
+    fill = commands.add_parser("fill", help="Pull the fill report for the managed sites")
+    fill.add_argument("--date", help="Day to pull as YYYY-MM-DD, defaults to today")
+    fill.add_argument("--prefix", default="D", help="Station prefix filter")
+    fill.add_argument("--out-dir", default=FILL_DIR)
+    fill.set_defaults(func=cmd_fill)
+
+    upload = commands.add_parser("upload", help="Upload files to the capacity uploader")
+    upload.add_argument("--type", required=True, help="Upload type, e.g. Demand")
+    upload.add_argument("--mode", choices=["http", "browser", "pool"], default=UPLOAD_MODE)
+    upload.add_argument("files", nargs="+")
+    upload.set_defaults(func=cmd_upload)
+
+    status = commands.add_parser("status", help="Show the processing status of uploaded files")
+    status.add_argument("--type", help="Upload type the files were submitted as")
+    status.add_argument("--wait", action="store_true", help="Poll until the files finish processing")
+    status.add_argument("--timeout", type=float, default=300)
+    status.add_argument("--failures", type=float, metavar="MINUTES", help="List uploads that failed in the last MINUTES")
+    status.add_argument("files", nargs="*")
+    status.set_defaults(func=cmd_status)
+
+    cookies = commands.add_parser("cookies", help="Validate, inspect or refresh the saved session cookies")
+    cookies.add_argument("--check", action="store_true", help="Only report on the saved cookies")
+    cookies.add_argument("--refresh", action="store_true", help="Log in again even if the cookies are valid")
+    cookies.set_defaults(func=cmd_cookies)
+
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    return args.func(args) or 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
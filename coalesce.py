@@ -0,0 +1,47 @@
+import asyncio
+import logging
+
+from metrics import METRICS
+
+logger = logging.getLogger(__name__)
+
+
+class RequestCoalescer:
+    """
+    Shares identical in-flight requests between callers.
+
+    The first call for a key starts the request; every call with the same key made
+    before it finishes awaits the same result instead of sending its own. Keys are
+    forgotten once the request completes, so later calls fetch fresh data.
+    """
+
+    def __init__(self, endpoint="demand"):
+        self.endpoint = endpoint
+        self.inflight = {}
+        self.shared = 0
+
+    def __contains__(self, key):
+        return key in self.inflight
+
+    async def run(self, key, factory):
+        """
+        Returns the result of factory() for this key, sharing a call already in flight.
+
+        Args:
+            key: Hashable request identity, e.g. (area_id, dates, demand type).
+            factory: Zero-argument callable returning the awaitable that does the work.
+        """
+        task = self.inflight.get(key)
+        if task is not None:
+            self.shared += 1
+            METRICS.inc("requests_coalesced_total", endpoint=self.endpoint)
+        else:
+            task = asyncio.ensure_future(factory())
+            self.inflight[key] = task
+            task.add_done_callback(lambda done: self._forget(key, done))
+        # A cancelled caller must not cancel the request for everyone else
+        return await asyncio.shield(task)
+
+    def _forget(self, key, task):
+        if self.inflight.get(key) is task:
+            del self.inflight[key]
@@ -0,0 +1,147 @@
+import time
+import random
+import asyncio
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class TransientError(Exception):
+    """A failure worth retrying: throttling, server errors or a dropped connection."""
+
+    def __init__(self, message, retry_after=None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class AuthError(Exception):
+    """The session is no longer authenticated: 401/403, a login redirect or an HTML page."""
+
+
+def parse_retry_after(value):
+    """Seconds to wait from a Retry-After header, if it holds a number."""
+    try:
+        return max(float(value), 0.0)
+    except (TypeError, ValueError):
+        return None
+
+
+class RetryPolicy:
+    """Jittered exponential backoff for transient request failures."""
+
+    def __init__(self, max_retries=3, base_delay=0.5, max_delay=30.0):
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+    def delay(self, attempt, retry_after=None):
+        """
+        Seconds to wait before the given retry attempt (0-based).
+
+        Uses "full jitter" so retries from many sites do not arrive in lockstep, and never
+        waits less than a Retry-After the server asked for.
+        """
+        delay = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+        if retry_after is not None:
+            delay = max(delay, min(retry_after, self.max_delay))
+        return delay
+
+
+class AdaptiveLimiter:
+    """
+    AIMD limit on in-flight requests.
+
+    The limit grows by roughly one slot per window of healthy responses and is cut
+    multiplicatively on errors, throttling or latency well above the healthy baseline.
+    """
+
+    def __init__(self, initial=15, min_limit=1, max_limit=60, backoff=0.7, tolerance=2.0, cooldown=1.0):
+        self.limit = float(initial)
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.backoff = backoff
+        self.tolerance = tolerance
+        self.cooldown = cooldown
+        self.in_flight = 0
+        self.baseline = None
+        self.peak = initial
+        self._last_decrease = 0.0
+        self._cond = asyncio.Condition()
+
+    async def acquire(self):
+        """Waits for a free slot under the current limit."""
+        async with self._cond:
+            await self._cond.wait_for(lambda: self.in_flight < int(self.limit))
+            self.in_flight += 1
+
+    async def release(self, latency, ok=True):
+        """Frees a slot and adjusts the limit from the request's outcome."""
+        async with self._cond:
+            self.in_flight -= 1
+            congested = self.baseline is not None and latency > self.baseline * self.tolerance
+
+            if not ok or congested:
+                # Many in-flight failures land together; only back off once per cooldown
+                now = time.monotonic()
+                if now - self._last_decrease >= self.cooldown:
+                    self.limit = max(self.min_limit, self.limit * self.backoff)
+                    self._last_decrease = now
+                    logger.debug(f"Concurrency reduced to {int(self.limit)}")
+            else:
+                self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+                self.peak = max(self.peak, int(self.limit))
+
+            if ok:
+                self.baseline = latency if self.baseline is None else 0.9 * self.baseline + 0.1 * latency
+
+            self._cond.notify_all()
+
+
+class AuthGate:
+    """
+    Holds new requests while the session is re-authenticated.
+
+    Requests that fail authentication call refresh() with the generation they were sent
+    under. The first one runs the refresher; the rest wait for it and then retry with the
+    new cookies. At most max_refreshes refreshes run, after which auth failures are final.
+    """
+
+    def __init__(self, max_refreshes=1):
+        self.max_refreshes = max_refreshes
+        self.generation = 0
+        self.refreshes = 0
+        self.healthy = True
+        self._open = asyncio.Event()
+        self._open.set()
+        self._lock = asyncio.Lock()
+
+    async def wait(self):
+        """Waits out any refresh in progress and returns the current generation."""
+        await self._open.wait()
+        return self.generation
+
+    async def refresh(self, generation, refresher):
+        """
+        Refreshes the session once per expiry. Returns True if the request should be retried.
+
+        Args:
+            generation: The generation the failed request was sent under.
+            refresher: Async callable returning True on success.
+        """
+        async with self._lock:
+            if generation != self.generation:
+                return self.healthy  # Someone else already refreshed
+            if self.refreshes >= self.max_refreshes:
+                return False
+
+            self._open.clear()
+            self.refreshes += 1
+            try:
+                self.healthy = bool(await refresher())
+            except Exception as e:
+                logger.error(f"Re-authentication failed: {e}")
+                self.healthy = False
+            finally:
+                self.generation += 1
+                self._open.set()
+            return self.healthy
@@ -3,14 +3,123 @@ from datetime import datetime
 
 BASE_URL = "https://logistics.amazon.co.uk"
 SUI_URL = "https://logistics.amazon.co.uk/internal/scheduling/dsps/api/getProviderDemandData"
+# Fill report endpoint. Assumed, not confirmed: the demand endpoint queried with a single "date" answers
+# {serviceTypeId: {serviceTypeName, providerDemandList}}; responses of any other shape are rejected per station
+FILL_URL = SUI_URL
 CAPACITY_UPLOADER_URL = "https://logistics.amazon.co.uk/internal/capacity/uploader"
 STATUS_URL = "https://logistics.amazon.co.uk/internal/capacity/api/statusRecordPage"
+# Upload endpoint and form fields of the browserless path are inferred from the uploader page, not confirmed
+UPLOAD_API_URL = "https://logistics.amazon.co.uk/internal/capacity/api/upload"
+UPLOAD_MODE = "browser"  # "browser" drives one Selenium form, "pool" runs headless workers, "http" posts files directly
+UPLOAD_WORKERS = 3  # headless browsers used for parallel browser uploads
+ORDERED_UPLOAD_TYPES = ["Demand"]  # upload types the backend needs processed in submission order
 
-# User Downloads
-LOGIN = os.getlogin()
+# Upload files generated from scraped data: per upload type, (upload column, scraped column, type, required).
+# Types are "string", "int", "float", "date" or "timestamp". Only Demand can be built from the demand scrape;
+# add the override and offer layouts here as their templates are confirmed.
+EXPORT_LAYOUTS = {
+    "Demand": [
+        ("station", "station", "string", True),
+        ("serviceAreaId", "area_id", "string", True),
+        ("date", "date", "date", True),
+        ("startTime", "startTime", "timestamp", True),
+        ("durationInMinutes", "durationInMinutes", "int", True),
+        ("waveGroupId", "waveGroupId", "string", False),
+        ("requiredQuantity", "requiredQuantity", "int", True),
+    ],
+}
+# Upload types whose layout has been checked against the uploader's template; only these are ever uploaded
+CONFIRMED_EXPORT_LAYOUTS = []
+EXPORT_MAX_BYTES = 5 * 1024 * 1024  # upload files are split into parts no larger than this
+
+# Pipelined scrape -> upload -> verify: rows per upload part (so uploads start early) and stage queue bound
+PIPELINE_PART_ROWS = 20000
+PIPELINE_QUEUE_SIZE = 64
+
+# User Downloads; LOGIN is resolved on first use (see __getattr__ below)
 DOWNLOADS = os.path.join(os.path.expanduser("~"), "Downloads")
 COOKIES_FILE = f"mdw_cookie_{datetime.now().strftime("%Y-%m-%d")}.pkl"
-COOKIES_PATH = os.path.join(DOWNLOADS, COOKIES_FILE)
+COOKIES_PATH = os.path.join(DOWNLOADS, COOKIES_FILE)  # at import; long-running processes use cookies_path()
 SITE_MAP = r"\\ant\dept-eu\TBA\UK\Business Analyses\CentralOPS\Scheduling\UK\FlexData\UKManagedMappings.csv"
+SITE_CACHE_DIR = os.path.join(DOWNLOADS, "site_map_cache")
+SITE_CACHE_MAX_AGE = 15 * 60  # seconds before the share is checked for changes again
 SAVE_PATH = os.path.join(DOWNLOADS, "scrape.csv")
-STATUS_COLS = ["fileType", "fileName", "uploadedDateTime", "uploadedBy", "status", "message"]
\ No newline at end of file
+EXPORT_DIR = os.path.join(DOWNLOADS, "uploads")
+STATUS_COLS = ["fileType", "fileName", "uploadedDateTime", "uploadedBy", "status", "message"]
+
+# Scrape concurrency: starting in-flight requests, adaptive ceiling and retries per site
+MAX_CONCURRENT = 15
+MAX_CONCURRENT_LIMIT = 40
+MAX_RETRIES = 3
+
+# Mid-run re-authentication: hosts that mean the session was bounced to login, refreshes per run, browser wait
+LOGIN_HOSTS = ["midway-auth.amazon.com"]
+REAUTH_ATTEMPTS = 1
+REAUTH_TIMEOUT = 5 * 60
+
+# Date window per demand request: None sends all num_days at once; adaptive sizes chunks from latency
+CHUNK_DAYS = None
+ADAPTIVE_CHUNKING = False
+
+# JSON decoding: "auto" prefers msgspec/orjson/ujson when installed; extraction keeps only the CSP fields we write
+JSON_DECODER = "auto"
+EXTRACT_FIELDS = True
+
+# Daemon mode: seconds between the starts of consecutive scrapes; with a refresh schedule a run
+# starts earlier once a slice falls due, but no more often than the shortest tier
+DAEMON_INTERVAL = 15 * 60
+
+# Horizon-tiered refresh: (first day offset, last day offset, seconds between refreshes); the last tier covers later days
+REFRESH_SCHEDULE = False
+REFRESH_TIERS = [(0, 1, 5 * 60), (2, 6, 60 * 60), (7, 27, 6 * 60 * 60)]
+REFRESH_STATE_PATH = os.path.join(DOWNLOADS, "refresh_schedule.json")
+
+# Run metrics (.prom/.txt for Prometheus text, otherwise JSON) and per-site debug log sampling
+METRICS_PATH = os.path.join(DOWNLOADS, "scrape_metrics.json")
+SITE_LOG_EVERY = 50
+
+# Days of demand forecast scraped per run, from today
+FORECAST_DAYS = 7
+
+# Append-only snapshot history: one file per run, partitioned by scrape date; finished days are compacted
+# into one file and days older than the retention are deleted (None keeps everything)
+KEEP_HISTORY = True
+HISTORY_DIR = os.path.join(DOWNLOADS, "scrape_history")
+HISTORY_RETENTION_DAYS = 35
+
+# Checkpointed runs: each (area, dates) request and its payload is recorded so a killed run can be resumed
+CHECKPOINT_RUNS = True
+LEDGER_PATH = os.path.join(DOWNLOADS, "scrape_ledger.sqlite")
+
+# Fill report (CSP blocks per station and service type) output folder and file name stem
+FILL_DIR = os.path.join(DOWNLOADS, "fill_report")
+FILL_FILE_NAME = "fill_report"
+
+# Local index of upload status records, refreshed from the newest record already seen.
+# The first refresh fetches this much history; unfinished uploads older than this no longer hold the refresh window open
+STATUS_INDEX_PATH = os.path.join(DOWNLOADS, "upload_status.sqlite")
+STATUS_INDEX_BACKFILL_HOURS = 24
+
+# Delta scraping: only (serviceAreaId, date) slices that changed since the last run are added to the
+# history; the output is rebuilt from the newest snapshot of every slice in it
+DELTA_SCRAPE = False
+RESPONSE_CACHE_PATH = os.path.join(DOWNLOADS, "scrape_cache.json")
+
+
+def cookies_path(day=None):
+    """Cookie file of a day, today by default. Logins save to a new file every day."""
+    return os.path.join(DOWNLOADS, f"mdw_cookie_{(day or datetime.now()).strftime('%Y-%m-%d')}.pkl")
+
+
+def __getattr__(name):
+    # os.getlogin() fails without a controlling terminal (cron, services), so it is only
+    # called when LOGIN is actually read, with the environment's user as the fallback
+    if name == "LOGIN":
+        try:
+            login = os.getlogin()
+        except OSError:
+            import getpass
+            login = getpass.getuser()
+        globals()["LOGIN"] = login
+        return login
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
\ No newline at end of file
@@ -1,13 +1,10 @@
-import requests
 from config import *
-from selenium import webdriver
-from selenium.webdriver.chrome.service import Service
-from selenium.webdriver.common.by import By
-from selenium.webdriver.support.ui import WebDriverWait
-from selenium.webdriver.support import expected_conditions as EC
 import logging
 import pickle
 import time
+import os
+import asyncio
+from urllib.parse import urlparse
 
 # Configure logging to emit to terminal
 logging.basicConfig(
@@ -18,37 +15,229 @@ logging.basicConfig(
 
 logger = logging.getLogger(__name__)
 
+# One jar per cookie file, shared by everything in the process
+_JARS = {}
+
+# Saved cookie keys Selenium accepts in add_cookie
+SELENIUM_COOKIE_KEYS = ("name", "value", "domain", "path", "expiry", "secure", "httpOnly", "sameSite")
+
+
+def _values(cookies):
+    """Cookie contents without expiry and flags, to tell a renewed session from the old one."""
+    return {(cookie.get("name"), cookie.get("value"), cookie.get("domain")) for cookie in cookies}
+
+
+class CookieJar:
+    """
+    Memoized, expiry-aware view of the saved session cookies.
+
+    The pickle is only re-read when the file changes on disk. The list and header string
+    forms are served from memory, and cookies rotated by the server during aiohttp or
+    requests sessions can be synced back and persisted.
+    """
+
+    def __init__(self, path=None):
+        self.path = path or cookies_path()
+        self.cookies = []
+        self.dirty = False
+        self.version = 0  # bumped whenever cookies are re-read from disk
+        self._mtime = None
+        self._string = None
+
+    @classmethod
+    def shared(cls, path=None):
+        """Returns the process-wide jar for a cookie file, today's by default."""
+        path = path or cookies_path()
+        if path not in _JARS:
+            _JARS[path] = cls(path)
+        return _JARS[path]
+
+    def load(self, force=False):
+        """Loads cookies from disk unless the in-memory copy is already current."""
+        try:
+            mtime = os.path.getmtime(self.path)
+        except OSError:
+            self.cookies, self._mtime, self._string = [], None, None
+            return self
+
+        if force or mtime != self._mtime:
+            with open(self.path, "rb") as f:
+                self.cookies = pickle.load(f) or []
+            self._mtime = mtime
+            self._string = None
+            self.dirty = False
+            self.version += 1
+        return self
+
+    def is_valid(self):
+        """True if no cookie that carries an expiry has expired."""
+        now = datetime.now().timestamp()
+        return all(cookie["expiry"] >= now for cookie in self.cookies if "expiry" in cookie)
+
+    def as_list(self):
+        return self.cookies
+
+    def as_string(self):
+        """Cookie header string, built once per set of cookies."""
+        if self._string is None:
+            self._string = "; ".join([f"{cookie['name']}={cookie['value']}" for cookie in self.cookies])
+        return self._string
+
+    def aiohttp_jar(self):
+        """Builds an aiohttp cookie jar so the session tracks Set-Cookie rotations."""
+        import aiohttp
+
+        jar = aiohttp.CookieJar()
+        self.fill_aiohttp(jar)
+        return jar
+
+    def fill_aiohttp(self, jar):
+        """Replaces the contents of an aiohttp cookie jar, e.g. of a live session, with these cookies."""
+        from http.cookies import Morsel
+        from yarl import URL
+
+        jar.clear()
+        default_host = BASE_URL.split("//")[1]
+        for cookie in self.cookies:
+            domain = cookie.get("domain") or default_host
+            morsel = Morsel()
+            morsel.set(cookie["name"], cookie["value"], cookie["value"])
+            morsel["domain"] = domain
+            morsel["path"] = cookie.get("path", "/")
+            if cookie.get("secure"):
+                morsel["secure"] = True
+            jar.update_cookies({cookie["name"]: morsel}, response_url=URL(f"https://{domain.lstrip('.')}/"))
+
+    def requests_jar(self):
+        """Builds a requests cookie jar so the session tracks Set-Cookie rotations."""
+        import requests
+
+        jar = requests.cookies.RequestsCookieJar()
+        for cookie in self.cookies:
+            jar.set(
+                cookie["name"], cookie["value"],
+                domain=cookie.get("domain", ""), path=cookie.get("path", "/"),
+                expires=cookie.get("expiry"), secure=cookie.get("secure", False)
+            )
+        return jar
+
+    def _update(self, name, value, domain, path, expiry):
+        """Applies one cookie seen in a live session, marking the jar dirty if it changed."""
+        for cookie in self.cookies:
+            if cookie["name"] == name and cookie.get("domain", "").lstrip(".") == domain.lstrip("."):
+                if cookie["value"] != value or (expiry and cookie.get("expiry") != expiry):
+                    cookie["value"] = value
+                    if expiry:
+                        cookie["expiry"] = int(expiry)
+                    self.dirty = True
+                return
+
+        new_cookie = {"name": name, "value": value, "domain": domain, "path": path or "/"}
+        if expiry:
+            new_cookie["expiry"] = int(expiry)
+        self.cookies.append(new_cookie)
+        self.dirty = True
+
+    def sync_from_aiohttp(self, jar):
+        """Pulls rotated cookies back from an aiohttp session's cookie jar."""
+        from email.utils import parsedate_to_datetime
+
+        for morsel in jar:
+            expiry = None
+            if morsel["expires"]:
+                try:
+                    expiry = parsedate_to_datetime(morsel["expires"]).timestamp()
+                except (TypeError, ValueError):
+                    pass
+            self._update(morsel.key, morsel.value, morsel["domain"], morsel["path"], expiry)
+        if self.dirty:
+            self._string = None
+
+    def sync_from_requests(self, jar):
+        """Pulls rotated cookies back from a requests session's cookie jar."""
+        for cookie in jar:
+            self._update(cookie.name, cookie.value, cookie.domain, cookie.path, cookie.expires)
+        if self.dirty:
+            self._string = None
+
+    def save(self):
+        """Persists rotated cookies so later runs start from the freshest session."""
+        if not self.dirty:
+            return
+        # Write-then-rename so concurrent readers never unpickle a half-written file
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as f:
+            pickle.dump(self.cookies, f)
+        os.replace(tmp_path, self.path)
+        self._mtime = os.path.getmtime(self.path)
+        self.dirty = False
+        logger.info(f"Saved {len(self.cookies)} rotated cookies to {self.path}")
+
+
 class Cookies:
     def __init__(self, url=SUI_URL):
         self.url = url
+        self.jar = CookieJar.shared(cookies_path())
+
+    def scrape_and_save(self, url, timeout=REAUTH_TIMEOUT):
+        """
+        Prompts authentication in a browser and saves session cookies.
+
+        The saved cookies are loaded into the browser first, so a still-valid SSO session
+        renews without any input. Cookies are saved as soon as the browser is back on the
+        target page rather than on a keypress. Returns True if fresh cookies were saved;
+        a browser left with the cookies it started from renewed nothing and returns False.
+        """
+        # Selenium is only imported once a browser is really needed
+        from selenium import webdriver
+        from selenium.webdriver.support.ui import WebDriverWait
 
-    def scrape_and_save(self, url):
-        """Prompts authentication and saves session cookies."""
-        
         driver = webdriver.Chrome()
+        host = urlparse(self.url).hostname
 
         try:
+            # Cookies can only be set on the domain currently open
+            for domain in {cookie.get("domain", host).lstrip(".") for cookie in self.jar.load().as_list()}:
+                driver.get(f"https://{domain}")
+                for cookie in self.jar.as_list():
+                    if cookie.get("domain", host).lstrip(".") == domain:
+                        try:
+                            driver.add_cookie({k: v for k, v in cookie.items() if k in SELENIUM_COOKIE_KEYS})
+                        except Exception:
+                            pass
+
             logger.info(f"Opening {self.url}...")
             driver.get(self.url)
 
-            # Wait for user to manually log in
-            logger.info("\nPlease log in manually in the browser window.")
-            logger.info("Once you're successfully logged in and can see the scheduling page,")
-            logger.info("press Enter here to save the cookies...")
-            input()
+            # Wait for the user to log in, if the SSO session did not renew on its own
+            logger.info("\nPlease log in manually in the browser window if prompted.")
+            logger.info(f"Cookies are saved once the page is back on {host} (waiting up to {timeout}s)...")
+            WebDriverWait(driver, timeout).until(
+                lambda d: urlparse(d.current_url).hostname == host and not any(
+                    login in d.current_url for login in LOGIN_HOSTS
+                )
+            )
 
             # Get all cookies
             cookies = driver.get_cookies()
+            if _values(cookies) == _values(self.jar.as_list()):
+                # An API answering 401/403 without a redirect passes the wait straight away
+                logger.error("The browser returned the same cookies, the session was not renewed")
+                return False
 
             # Save cookies to file
-            with open(COOKIES_PATH, 'wb') as f:
-                pickle.dump(cookies, f)
+            self.jar.cookies = cookies
+            self.jar.dirty = True
+            self.jar.save()
+            self.jar.load(force=True)
 
             logger.info(f"\nCookies saved successfully to: {DOWNLOADS}")
             logger.info(f"Total cookies saved: {len(cookies)}")
+            return True
 
         except Exception as e:
             logger.error(f"Error: {e}")
+            return False
 
         finally:
             # Close the browser
@@ -56,6 +245,17 @@ class Cookies:
             time.sleep(1)
             driver.quit()
 
+    async def refresh_async(self, timeout=REAUTH_TIMEOUT):
+        """
+        Re-authenticates from inside a running scrape.
+
+        The browser runs on a worker thread so the event loop stays responsive.
+        Returns the refreshed jar, or None if authentication failed.
+        """
+        loop = asyncio.get_running_loop()
+        ok = await loop.run_in_executor(None, self.scrape_and_save, self.url, timeout)
+        return self.jar if ok else None
+
     def is_valid(self, cookie):
         """Checks whether cookie is valid or expired."""
         if "expiry" in cookie.keys():
@@ -77,19 +277,17 @@ class Cookies:
                       If False, returns list of cookie dictionaries.
         """
         try:
-            with open(COOKIES_PATH, "rb") as f:
-                cookies = pickle.load(f)
-                if cookies:
-                    logger.info("Saved cookies found")
-                    if as_string:
-                        # Format all cookies as "name=value; name2=value2"
-                        cookie_string = "; ".join([f"{cookie['name']}={cookie['value']}" for cookie in cookies])
-                        return cookie_string
-                    else:
-                        return cookies
+            cookies = self.jar.load().as_list()
+            if cookies:
+                logger.info("Saved cookies found")
+                if as_string:
+                    # Format all cookies as "name=value; name2=value2"
+                    return self.jar.as_string()
                 else:
-                    logger.info(f"No cookies found in the {DOWNLOADS}")
-                    return None
+                    return cookies
+            else:
+                logger.info(f"No cookies found in the {DOWNLOADS}")
+                return None
 
         except Exception as e:
             logger.error(f"Error: {e}")
@@ -104,12 +302,11 @@ class Cookies:
             try:
                 if cookies_list:
                     # Check if all cookies are valid
-                    all_valid = all(self.is_valid(cookie) for cookie in cookies_list if "expiry" in cookie)
-                    if all_valid or not any("expiry" in cookie for cookie in cookies_list):
+                    if self.jar.is_valid():
                         logger.info(f"Valid cookies found. Total: {len(cookies_list)}")
                         # Return in requested format
                         if as_string:
-                            return "; ".join([f"{cookie['name']}={cookie['value']}" for cookie in cookies_list])
+                            return self.jar.as_string()
                         else:
                             return cookies_list
                     else:
@@ -125,6 +322,11 @@ class Cookies:
         logger.error("Failed. Could not load cookies.")
         return [] if not as_string else ""
 
+    def get_jar(self, max_attempts=1):
+        """Validates the saved cookies like main() and returns the shared jar."""
+        self.main(as_string=False, max_attempts=max_attempts)
+        return self.jar
+
 
 
 
@@ -0,0 +1,155 @@
+import os
+import time
+import signal
+import asyncio
+import logging
+from config import *
+from cookie_scrape import Cookies, CookieJar
+from site_scrape import SiteScraper
+from response_cache import ResponseCache
+from concurrency import AdaptiveLimiter
+from writer import DemandWriter, write_latest
+from history import HistoryStore
+from metrics import METRICS
+from refresh_schedule import RefreshScheduler
+
+logger = logging.getLogger(__name__)
+
+
+class ScrapeDaemon:
+    """
+    Long-running scraper that keeps its session, cookie jar and site map warm.
+
+    Re-scrapes every interval seconds over the same connection pool, so a refresh
+    only costs the network round trips. Each run's output is written to a temporary
+    file and moved over the previous one, so readers never see a partial file.
+
+    When runs only fetch part of the forecast (a refresh schedule or delta scraping),
+    the output is rebuilt from the newest snapshot of every slice in the history.
+    """
+
+    def __init__(self, scraper=None, interval=DAEMON_INTERVAL, output=SAVE_PATH, site_filters=None, max_concurrent=MAX_CONCURRENT):
+        cache = ResponseCache(RESPONSE_CACHE_PATH) if DELTA_SCRAPE else None
+        scheduler = RefreshScheduler(REFRESH_TIERS, REFRESH_STATE_PATH) if REFRESH_SCHEDULE else None
+        self.scraper = scraper or SiteScraper(SUI_URL, num_days=FORECAST_DAYS, cache=cache, scheduler=scheduler)
+        self.interval = interval
+        self.output = output
+        self.site_filters = site_filters if site_filters is not None else {"prefix": "D"}
+        self.max_concurrent = max_concurrent
+        self.jar = Cookies(SUI_URL).get_jar()
+        self.limiter = None
+        self.session = None
+        self._jar_version = None
+        self._sites_loaded = 0.0
+        self._sites = []
+        self._stop = asyncio.Event()
+
+    def stop(self):
+        logger.info("Stopping after the current run...")
+        self._stop.set()
+
+    async def ensure_session(self):
+        """Opens the session once, and again only if the cookies were re-authenticated on disk."""
+        # The cookie file is dated, so after midnight a login lands in a new file;
+        # keep the current one until that exists
+        path = cookies_path()
+        if path != self.jar.path and os.path.exists(path):
+            logger.info(f"Switching to cookie file {path}")
+            self.jar = CookieJar.shared(path)
+        self.jar.load()
+        if self.session is not None and self._jar_version == (self.jar.path, self.jar.version):
+            return
+        if self.session is not None:
+            logger.info("Cookies changed on disk, reopening session")
+            await self.session.close()
+        self.session = self.scraper.open_session(self.jar)
+        self._jar_version = (self.jar.path, self.jar.version)
+
+    def sites(self):
+        """Site list from the in-memory site map, reloaded once its cache window has passed."""
+        if self.scraper.sites is not None and time.time() - self._sites_loaded > SITE_CACHE_MAX_AGE:
+            self.scraper.sites.load()
+            self._sites_loaded = time.time()
+        sites = self.scraper.get_sites(**self.site_filters)
+        if not self._sites_loaded:
+            self._sites_loaded = time.time()
+        return sites
+
+    async def run_once(self):
+        """Scrapes every site once and atomically replaces the output file."""
+        await self.ensure_session()
+        self.scraper.refresh_dates()
+        sites = self._sites = self.sites()
+        if self.scraper.scheduler is not None:
+            sites = self.scraper.scheduler.plan(sites, self.scraper.dates_list)
+        if self.limiter is None:
+            # Kept across runs so the learned concurrency carries over
+            self.limiter = AdaptiveLimiter(initial=self.max_concurrent, max_limit=MAX_CONCURRENT_LIMIT)
+
+        root, ext = os.path.splitext(self.output)
+        tmp_path = f"{root}.tmp{ext}"
+        partial = self.scraper.scheduler is not None or self.scraper.cache is not None
+        history = None
+        if KEEP_HISTORY or partial:
+            history = HistoryStore(HISTORY_DIR, retention_days=HISTORY_RETENTION_DAYS)
+        with DemandWriter(None if partial else tmp_path, capacity_type="CSP", history=history) as writer:
+            scraped = await self.scraper.dispatch(self.session, sites, self.limiter, writer)
+        logger.info(f"Scraped {scraped}/{len(sites)} sites, {writer.rows} new CSP rows")
+
+        if partial:
+            write_latest(history, tmp_path, lookback_days=self.scraper.num_days)
+        if os.path.exists(tmp_path):
+            os.replace(tmp_path, self.output)
+            logger.info(f"Output saved to {self.output}")
+
+        self.jar.sync_from_aiohttp(self.session.cookie_jar)
+        self.jar.save()
+        self.scraper.save_cache()
+        METRICS.write(METRICS_PATH)
+
+    def next_wait(self, started):
+        """
+        Seconds to sleep before the next run, from the monotonic start of the last one.
+
+        Runs start every interval seconds. With a refresh schedule they start as soon
+        as a slice falls due instead, but never sooner than the shortest tier after
+        the last start, so slices that keep failing are not retried in a tight loop.
+        """
+        elapsed = time.monotonic() - started
+        wait = self.interval
+        scheduler = self.scraper.scheduler
+        if scheduler is not None and self._sites:
+            due = elapsed + scheduler.next_due(self._sites, self.scraper.dates_list)
+            wait = min(wait, max(scheduler.min_interval, due))
+        return max(0.0, wait - elapsed)
+
+    async def run(self):
+        """Runs until stopped, starting a new scrape every interval seconds or when slices fall due."""
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            try:
+                loop.add_signal_handler(sig, self.stop)
+            except (NotImplementedError, RuntimeError):
+                pass  # Windows event loops do not support signal handlers
+
+        try:
+            while not self._stop.is_set():
+                started = time.monotonic()
+                try:
+                    await self.run_once()
+                except Exception as e:
+                    logger.error(f"Scrape run failed: {e}")
+
+                wait = self.next_wait(started)
+                logger.info(f"Next scrape in {wait:.0f}s")
+                try:
+                    await asyncio.wait_for(self._stop.wait(), timeout=wait)
+                except asyncio.TimeoutError:
+                    pass
+        finally:
+            if self.session is not None:
+                await self.session.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(ScrapeDaemon().run())
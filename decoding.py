@@ -0,0 +1,108 @@
+import json
+import asyncio
+import logging
+from typing import Any
+
+logger = logging.getLogger(__name__)
+
+
+class DecodeError(ValueError):
+    """Raised by every decoder backend for a body that is not a valid demand payload."""
+
+
+def _stdlib():
+    return json.loads
+
+
+def _orjson():
+    import orjson
+    return orjson.loads
+
+
+def _ujson():
+    import ujson
+    return ujson.loads
+
+
+def _msgspec():
+    import msgspec
+    return msgspec.json.Decoder().decode
+
+
+# Optional faster backends are tried in this order by "auto"
+BACKENDS = {"msgspec": _msgspec, "orjson": _orjson, "ujson": _ujson, "json": _stdlib}
+
+
+def get_decoder(backend="auto"):
+    """Returns a bytes -> object JSON decoder for the named backend."""
+    if backend != "auto":
+        return BACKENDS[backend]()
+    for name, loader in BACKENDS.items():
+        try:
+            decoder = loader()
+            logger.debug(f"Using {name} JSON decoder")
+            return decoder
+        except ImportError:
+            continue
+
+
+class PayloadDecoder:
+    """
+    Decodes raw demand responses with a configurable backend.
+
+    With fields set, only those fields of blocks matching capacity_type are kept. When
+    msgspec is available, the other fields are skipped while parsing instead of being
+    built and thrown away. Bodies above thread_bytes are decoded in a worker thread so
+    the event loop keeps serving other responses.
+    """
+
+    def __init__(self, backend="auto", fields=None, capacity_type="CSP", thread_bytes=256 * 1024):
+        self.fields = list(fields) if fields else None
+        self.capacity_type = capacity_type
+        self.thread_bytes = thread_bytes
+        self._decode = None
+
+        if self.fields and backend in ("auto", "msgspec"):
+            try:
+                self._decode = self._msgspec_extractor()
+            except ImportError:
+                if backend == "msgspec":
+                    raise
+        if self._decode is None:
+            loads = get_decoder(backend)
+            self._decode = (lambda body: self._prune(loads(body))) if self.fields else loads
+
+    def _msgspec_extractor(self):
+        import msgspec
+
+        names = list(dict.fromkeys(self.fields + ["capacityType"]))
+        Block = msgspec.defstruct("Block", [(name, Any, None) for name in names])
+        decoder = msgspec.json.Decoder(dict[str, list[Block]])
+        fields, capacity_type = self.fields, self.capacity_type
+
+        def decode(body):
+            return {
+                date: [{name: getattr(block, name) for name in fields} for block in blocks if block.capacityType == capacity_type]
+                for date, blocks in decoder.decode(body).items()
+            }
+        return decode
+
+    def _prune(self, payload):
+        """Drops blocks of other capacity types and fields that are not needed."""
+        fields, capacity_type = self.fields, self.capacity_type
+        return {
+            date: [{name: block.get(name) for name in fields} for block in blocks if block.get("capacityType") == capacity_type]
+            for date, blocks in payload.items()
+        }
+
+    def decode(self, body):
+        try:
+            return self._decode(body)
+        except Exception as e:
+            raise DecodeError(str(e)) from e
+
+    async def decode_async(self, body):
+        """Decodes inline for small bodies and in a worker thread for large ones."""
+        if len(body) < self.thread_bytes:
+            return self.decode(body)
+        return await asyncio.get_running_loop().run_in_executor(None, self.decode, body)
@@ -1,5 +1,5 @@
 import boto3
-import pandas as pd
+import asyncio
 from datetime import datetime
 import getpass
 import pickle
@@ -7,8 +7,8 @@ import time
 import requests
 import json
 import os
-from collections import defaultdict
 from src.config.settings import *
+from fill_report import FillScraper, pull_fill, save_fill_report
 
 from selenium import webdriver
 from selenium.webdriver.common.by import By
@@ -178,112 +178,24 @@ class API():
 
    
     def get_data(self):
-        self.routes = defaultdict(list)
-        
-        headers = {
-            "Cache-Control": "no-cache",
-            "Pragma": "no-cache",
-            "If-Modified-Since": "Sat, 1 Jan 2000 00:00:00 GMT"
-        }
-        
-         # Convert cookies list to dictionary format
-        cookies_dict = {}
-        for cookie in self.cookies:
-            cookies_dict[cookie.get('name')] = cookie.get('value')
-        
-        for _, row in control_table.iterrows():
-            pull_station = row["Station"]
-            pull_date = datetime.now() #strptime('2025-01-20', "%Y-%m-%d") #'2025-01-20'
-            pull_service_area = row["area_id"]
-            url_date = pull_date.strftime("%Y-%m-%d")
-
-            params = {
-                "serviceAreaId": pull_service_area,
-                "providerDemandType": "Forecast",   
-                "date": url_date,
-                "_": int(datetime.now().timestamp())
-                }
-
-            response = requests.get(url_template, headers=headers, params=params, cookies=cookies_dict)
-            response.raise_for_status()
-            
-            if response.status_code == 200:
-                data = response.json()
-
-                for service_type_id, service_data in data.items():
-                    service_type = service_data.get("serviceTypeName")
-                    provider_demand_list = service_data.get("providerDemandList", [])
+        """Pulls today's fill blocks for every station in the control table concurrently."""
+        sites = [
+            {"station": station, "area_id": area_id}
+            for station, area_id in zip(control_table["Station"], control_table["area_id"])
+        ]
+        cookie_header = "; ".join(f"{cookie.get('name')}={cookie.get('value')}" for cookie in self.cookies)
+
+        self.routes = asyncio.run(pull_fill(sites, cookie_header, scraper=FillScraper(url_template)))
+        stations = len(set(self.routes["Station"].to_pylist()))
+        print(f"Pulled {self.routes.num_rows} blocks for {stations}/{len(sites)} stations")
+        return stations
 
-                    counter = 0
-                    for demand in provider_demand_list:
-                        capacity_type = demand.get("capacityType")
-                        start_time = datetime.fromtimestamp(demand.get("startTime") / 1000)
-                        wave = demand.get("waveGroupId")
-                        duration = demand.get("durationInMinutes")
-                        scheduled = demand.get("requiredQuantity")
-                        accepted = demand.get("scheduledQuantity")
-
-                        if capacity_type == "CSP":
-                            key = f"{pull_station}-{service_type}-{wave}-{start_time}-{duration}"
-                            self.routes[key].append({
-                                "station": pull_station,
-                                "service_type": service_type,
-                                "wave": wave,
-                                "start_time": start_time,
-                                "duration": duration,
-                                "scheduled": scheduled,
-                                "accepted": accepted
-                            })
-                    if counter == 10:
-                        break
-        print('Status Response:')
-        print(response.status_code)
-        return response.status_code
-    
     def save_file_locally(self):
         try:
-            records = []
-            
-            for key, route_list in self.routes.items():
-                for route in route_list:
-                    record = {
-                        "Last_Refresh": pd.Timestamp(datetime.now()).floor('min'),  
-                        "Block_Date_Time": pd.Timestamp(route["start_time"]).floor('min'),
-                        "Station": route["station"],
-                        "ServiceType": route["service_type"],
-                        "Cycle": route["wave"],
-                        "Duration": route["duration"],
-                        "Scheduled": route["scheduled"],
-                        "Accepted": route["accepted"]
-                    }
-                    records.append(record)
-            
-            # Create and modify df
-            df = pd.DataFrame(records)
-            df = df.sort_values('Block_Date_Time')
-            
-            df_co = pd.DataFrame(records)
-            df_co = df_co.rename(columns={'Last_Refresh': 'Runtime'})
-            df_co['OFDDate'] = df_co['Block_Date_Time'].dt.date
-            df_co['Pending'] = df_co['Scheduled'] - df_co['Accepted'] 
-            df_co['Fill'] = round(df_co['Accepted'] / df_co['Scheduled'], 1)
-            df_co = df_co.query('Pending > 0')
-            df_co['Next Wave Start'] = (df_co['Block_Date_Time'] + pd.Timedelta(minutes=15)).dt.time
-
-            columns_order = ['Runtime', 'OFDDate', 'Station', 'Cycle', 'ServiceType', 
-                            'Scheduled', 'Accepted', 'Pending', 'Fill', 'Next Wave Start'] 
-            df_co = df_co[columns_order]
+            paths = save_fill_report(self.routes, self.local_file, self.file_name)
+            print("Files successfully saved to:\n" + "\n".join(paths))
+            print(self.routes.slice(0, 3).to_pandas())
 
-            csv_path_1 = os.path.join(self.local_file, 'CO_Format_Pull.csv')
-            csv_path_2 = os.path.join(self.local_file, f'{self.file_name}.csv')
-            parquet_path = os.path.join(self.local_file, f'{self.file_name}.parquet')
-            
-            df_co.to_csv(csv_path_1, index=False)
-            df.to_csv(csv_path_2, index=False)
-            df.to_parquet(parquet_path, index=False)
-            print(f"Files successfully saved to:\n{csv_path_1}\n{csv_path_2}\n{parquet_path}")
-            print(df.head(3))
-            
         except Exception as e:
             print(f"Error saving files: {str(e)}")
     
@@ -0,0 +1,210 @@
+import os
+import time
+import asyncio
+import logging
+
+import pyarrow as pa
+import pyarrow.csv as pacsv
+import pyarrow.parquet as pq
+
+from config import *
+from cookie_scrape import Cookies
+from uploader import HttpUploader, upload_files, verify_uploads
+
+logger = logging.getLogger(__name__)
+
+EXPORT_TYPES = {
+    "string": pa.string(),
+    "int": pa.int64(),
+    "float": pa.float64(),
+    "date": pa.date32(),
+    "timestamp": pa.timestamp("ms"),
+}
+
+# Rows written to a new part before its bytes per row are known
+PROBE_ROWS = 1000
+
+
+class ExportSchemaError(ValueError):
+    """Scraped data does not fit an upload file layout."""
+
+
+def read_batches(path, batch_rows=65536):
+    """Streams a scraped CSV or Parquet output as record batches."""
+    if path.lower().endswith(".parquet"):
+        yield from pq.ParquetFile(path).iter_batches(batch_size=batch_rows)
+        return
+    reader = pacsv.open_csv(path, read_options=pacsv.ReadOptions(block_size=1 << 22))
+    for batch in reader:
+        yield batch
+
+
+class UploadFileWriter:
+    """
+    Streams rows into uploader files of one type, in size-limited parts.
+
+    Every batch is validated against the layout and converted to it before anything
+    is written. A new part, with its own header, is started before the current one
+    would exceed max_bytes (or max_rows), so large outputs become several files that
+    can be uploaded and processed in parallel. Closed parts are listed in finished.
+
+    Args:
+        upload_type: Uploader file type, e.g. Demand.
+        layout: List of (upload column, scraped column, type, required), see EXPORT_LAYOUTS.
+        name: File name stem; parts are named <name>_partNNN.csv.
+    """
+
+    def __init__(self, upload_type, layout, out_dir=EXPORT_DIR, max_bytes=EXPORT_MAX_BYTES, name=None, max_rows=None):
+        self.upload_type = upload_type
+        self.layout = layout
+        self.out_dir = out_dir
+        self.max_bytes = max_bytes
+        self.max_rows = max_rows
+        self.name = name or f"{upload_type.replace(' ', '_')}_{time.strftime('%Y%m%d_%H%M%S')}"
+        self.schema = pa.schema([(column, EXPORT_TYPES[dtype]) for column, _, dtype, _ in layout])
+        self.parts = []
+        self.finished = []
+        self.rows = 0
+        self._sink = None
+        self._writer = None
+        self._part_rows = 0
+        self._row_bytes = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, *exc):
+        self.close(discard=exc_type is not None)
+
+    def validate(self, table):
+        """Returns the table in the upload layout, or raises ExportSchemaError."""
+        missing = [source for _, source, _, _ in self.layout if source not in table.column_names]
+        if missing:
+            raise ExportSchemaError(f"{self.upload_type}: scraped data has no {', '.join(missing)} column")
+
+        arrays = []
+        for column, source, dtype, required in self.layout:
+            array = table[source]
+            if pa.types.is_dictionary(array.type):
+                array = array.cast(array.type.value_type)
+            try:
+                array = array.cast(EXPORT_TYPES[dtype])
+            except (pa.ArrowInvalid, pa.ArrowNotImplementedError) as e:
+                raise ExportSchemaError(f"{self.upload_type}: {source} cannot be written as {dtype} {column}: {e}")
+            if required and array.null_count:
+                raise ExportSchemaError(f"{self.upload_type}: {array.null_count} rows have no {column}")
+            arrays.append(array)
+        return pa.Table.from_arrays(arrays, schema=self.schema)
+
+    def write(self, table):
+        """Validates and appends a batch of scraped rows. Returns rows written."""
+        table = self.validate(table)
+        offset = 0
+        while offset < table.num_rows:
+            if self._writer is None:
+                self._open_part()
+
+            if self._row_bytes is None:
+                n = PROBE_ROWS
+            else:
+                n = (self.max_bytes - self._sink.tell()) // self._row_bytes
+            if self.max_rows:
+                n = min(n, self.max_rows - self._part_rows)
+            if n <= 0 and self._part_rows:
+                self._close_part()
+                continue
+            n = max(1, min(n, table.num_rows - offset))
+
+            before = self._sink.tell()
+            self._writer.write_table(table.slice(offset, n))
+            # Keep the widest rows seen, so later parts stay under the limit
+            self._row_bytes = max(self._row_bytes or 0, -(-(self._sink.tell() - before) // n))
+            self._part_rows += n
+            offset += n
+
+        self.rows += table.num_rows
+        return table.num_rows
+
+    def _open_part(self):
+        os.makedirs(self.out_dir, exist_ok=True)
+        path = os.path.join(self.out_dir, f"{self.name}_part{len(self.parts) + 1:03d}.csv")
+        self._sink = pa.OSFile(path, "wb")
+        self._writer = pacsv.CSVWriter(self._sink, self.schema)
+        self._part_rows = 0
+        self.parts.append(path)
+
+    def _close_part(self):
+        self._writer.close()
+        self._sink.close()
+        self._writer = self._sink = None
+        self.finished.append(self.parts[-1])
+
+    def close(self, discard=False):
+        """Finishes the last part. With discard, removes every part written so far."""
+        if self._writer is not None:
+            self._close_part()
+        if discard:
+            for path in self.parts:
+                if os.path.exists(path):
+                    os.remove(path)
+            self.parts, self.finished = [], []
+        elif self.parts:
+            logger.info(f"Wrote {self.rows} {self.upload_type} rows to {len(self.parts)} upload files")
+        return self.parts
+
+
+def export_uploads(source=SAVE_PATH, upload_types=None, out_dir=EXPORT_DIR, max_bytes=EXPORT_MAX_BYTES):
+    """
+    Turns a scraped output file into upload files for each configured upload type.
+
+    Nothing is kept if any batch fails validation. Returns [(upload_type, path), ...]
+    ready for upload_parts.
+    """
+    writers = [
+        UploadFileWriter(upload_type, EXPORT_LAYOUTS[upload_type], out_dir, max_bytes)
+        for upload_type in (upload_types or EXPORT_LAYOUTS)
+    ]
+    try:
+        for batch in read_batches(source):
+            table = pa.Table.from_batches([batch])
+            for writer in writers:
+                writer.write(table)
+    except Exception:
+        for writer in writers:
+            writer.close(discard=True)
+        raise
+
+    return [(writer.upload_type, path) for writer in writers for path in writer.close()]
+
+
+def check_uploadable(upload_types):
+    """Raises ValueError unless every upload type's layout is in CONFIRMED_EXPORT_LAYOUTS."""
+    unconfirmed = sorted(set(upload_types) - set(CONFIRMED_EXPORT_LAYOUTS))
+    if unconfirmed:
+        raise ValueError(
+            f"Upload layout not confirmed for {', '.join(unconfirmed)}; check it against the uploader "
+            f"template and add it to CONFIRMED_EXPORT_LAYOUTS before uploading"
+        )
+
+
+def upload_parts(parts, cookies=None, workers=UPLOAD_WORKERS, timeout=300, mode=UPLOAD_MODE):
+    """
+    Uploads export parts and waits for all of them to finish processing.
+
+    Only confirmed layouts are uploaded. Parts are posted over HTTP in parallel in
+    "http" mode, otherwise through the browser upload paths. Parts of an ordered
+    upload type (ORDERED_UPLOAD_TYPES, which includes Demand) still share one lane
+    and go one after another. Returns one result per part with the final status
+    record under "status".
+    """
+    check_uploadable({upload_type for upload_type, _ in parts})
+    if mode != "http":
+        return upload_files(parts, mode=mode, timeout=timeout)
+
+    cookies = cookies or Cookies(CAPACITY_UPLOADER_URL).get_jar()
+    http = HttpUploader(cookies, pool_size=max(8, workers))
+    try:
+        results = http.upload_batch(parts, workers=workers)
+    finally:
+        http.close()
+    return verify_uploads(parts, results, cookies, timeout=timeout)
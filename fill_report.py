@@ -0,0 +1,217 @@
+import os
+import asyncio
+import logging
+from datetime import datetime, timedelta
+
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.csv as pacsv
+import pyarrow.parquet as pq
+
+from config import *
+from cookie_scrape import Cookies
+from site_scrape import SiteScraper
+from decoding import PayloadDecoder
+from normalize import CATEGORY, decode_dictionaries
+
+logger = logging.getLogger(__name__)
+
+FILL_SCHEMA = pa.schema([
+    ("Block_Date_Time", pa.timestamp("ms")),
+    ("Station", CATEGORY),
+    ("ServiceType", CATEGORY),
+    ("Cycle", CATEGORY),
+    ("Duration", pa.int32()),
+    ("Scheduled", pa.int64()),
+    ("Accepted", pa.int64()),
+])
+
+CO_COLUMNS = ["Runtime", "OFDDate", "Station", "Cycle", "ServiceType",
+              "Scheduled", "Accepted", "Pending", "Fill", "Next Wave Start"]
+
+
+class FillScraper(SiteScraper):
+    """
+    Fill report pull on the concurrent scrape engine.
+
+    Sends one single-date request per service area over a pooled session, with the
+    same adaptive limiter, retries, re-authentication and request sharing between
+    stations of an area as the demand scrape. Responses have the shape
+    {serviceTypeId: {serviceTypeName, providerDemandList}}.
+    """
+
+    def __init__(self, url=FILL_URL, site_map=SITE_MAP, date=None, **kwargs):
+        self.date = date
+        kwargs.setdefault("decoder", PayloadDecoder(backend=JSON_DECODER))
+        super().__init__(url, site_map, num_days=1, **kwargs)
+
+    def refresh_dates(self):
+        self.dates_list = [self.date or datetime.today().strftime("%Y-%m-%d")]
+
+    def request_params(self, site, dates):
+        return {
+            "serviceAreaId": site["area_id"],
+            "providerDemandType": self.demand_type,
+            "date": dates[0],
+            "_": int(datetime.now().timestamp() * 1000)
+        }
+
+
+def _local_time(epoch_ms):
+    """Epoch milliseconds to naive local timestamps, like datetime.fromtimestamp."""
+    # Blocks share a handful of wave start times, so only the distinct values are converted
+    unique = pc.unique(epoch_ms)
+    local = pa.array(
+        [None if value is None else datetime.fromtimestamp(value / 1000) for value in unique.to_pylist()],
+        pa.timestamp("ms")
+    )
+    return pc.take(local, pc.index_in(epoch_ms, unique))
+
+
+def normalize_fill(site, payload, capacity_type="CSP"):
+    """
+    Builds a typed fill table from one station's response.
+
+    Columns are filled per service type straight from the blocks, with the service
+    type stored once as a dictionary entry, so no per-block objects or string keys
+    are built. Raises ValueError if the response is not shaped
+    {serviceTypeId: {serviceTypeName, providerDemandList: [...]}}, e.g. the
+    {date: [blocks]} answer of the demand endpoint.
+    """
+    if not isinstance(payload, dict):
+        raise ValueError(f"Fill response is a {type(payload).__name__}, expected an object per service type")
+    for service_type, service_data in payload.items():
+        if not isinstance(service_data, dict) or not isinstance(service_data.get("providerDemandList") or [], list):
+            raise ValueError(f"Fill response entry {service_type!r} is not a service type with a providerDemandList")
+
+    type_index, type_values = [], []
+    columns = {name: [] for name in ["startTime", "waveGroupId", "durationInMinutes",
+                                     "requiredQuantity", "scheduledQuantity"]}
+
+    for service_data in payload.values():
+        blocks = [block for block in service_data.get("providerDemandList") or []
+                  if block.get("capacityType") == capacity_type]
+        if not blocks:
+            continue
+        type_index.extend([len(type_values)] * len(blocks))
+        type_values.append(service_data.get("serviceTypeName"))
+        for name, values in columns.items():
+            values.extend([block.get(name) for block in blocks])
+
+    length = len(type_index)
+    arrays = [
+        _local_time(pa.array(columns["startTime"], pa.int64())),
+        pa.DictionaryArray.from_arrays(pa.array([0] * length, pa.int32()), pa.array([str(site.get("station"))])),
+        pa.DictionaryArray.from_arrays(pa.array(type_index, pa.int32()), pa.array(type_values, pa.string())),
+        pa.array(columns["waveGroupId"], pa.string()).dictionary_encode(),
+        pa.array(columns["durationInMinutes"], pa.int32()),
+        pa.array(columns["requiredQuantity"], pa.int64()),
+        pa.array(columns["scheduledQuantity"], pa.int64()),
+    ]
+    return pa.Table.from_arrays(arrays, schema=FILL_SCHEMA)
+
+
+class FillCollector:
+    """Writer for SiteScraper.scrape_all that normalizes each station's response as it arrives."""
+
+    def __init__(self, capacity_type="CSP"):
+        self.capacity_type = capacity_type
+        self.tables = []
+
+    def write(self, site, payload, history=True):
+        table = normalize_fill(site, payload, self.capacity_type)
+        self.tables.append(table)
+        return table.num_rows
+
+    def table(self):
+        """Every collected block in one table, with dictionaries unified across stations."""
+        if not self.tables:
+            return FILL_SCHEMA.empty_table()
+        return pa.concat_tables(self.tables).unify_dictionaries().combine_chunks()
+
+
+async def pull_fill(sites, cookies, date=None, scraper=None, max_concurrent=MAX_CONCURRENT):
+    """
+    Pulls the fill blocks of every site concurrently.
+
+    cookies is a Cookie header string or a CookieJar. Returns a FILL_SCHEMA table.
+    """
+    scraper = scraper or FillScraper(date=date)
+    collector = FillCollector()
+    scraped = await scraper.scrape_all(sites, cookies, max_concurrent=max_concurrent, writer=collector)
+    table = collector.table()
+    logger.info(f"Fill pull: {scraped}/{len(sites)} stations, {table.num_rows} CSP blocks")
+    return table
+
+
+def fill_tables(table, refreshed=None):
+    """
+    Builds the fill report from pulled blocks.
+
+    Returns (blocks, co_format): every block sorted by start time, and the CO format
+    pull of blocks that still have pending capacity.
+    """
+    refreshed = pa.scalar((refreshed or datetime.now()).replace(second=0, microsecond=0), pa.timestamp("ms"))
+    block_time = pc.floor_temporal(table["Block_Date_Time"], unit="minute")
+
+    blocks = table.set_column(0, "Block_Date_Time", block_time)
+    blocks = blocks.add_column(0, "Last_Refresh", pa.repeat(refreshed, blocks.num_rows))
+    blocks = blocks.sort_by("Block_Date_Time")
+
+    pending = pc.subtract(table["Scheduled"], table["Accepted"])
+    fill = pc.round(pc.divide(pc.cast(table["Accepted"], pa.float64()), pc.cast(table["Scheduled"], pa.float64())), 1)
+    co_format = pa.table({
+        "Runtime": pa.repeat(refreshed, table.num_rows),
+        "OFDDate": pc.cast(block_time, pa.date32()),
+        "Station": table["Station"],
+        "Cycle": table["Cycle"],
+        "ServiceType": table["ServiceType"],
+        "Scheduled": table["Scheduled"],
+        "Accepted": table["Accepted"],
+        "Pending": pending,
+        "Fill": fill,
+        "Next Wave Start": pc.cast(pc.add(block_time, pa.scalar(timedelta(minutes=15))), pa.time32("s")),
+    })
+    co_format = co_format.filter(pc.greater(co_format["Pending"], 0)).select(CO_COLUMNS)
+    return blocks, co_format
+
+
+def save_fill_report(table, out_dir=FILL_DIR, file_name=FILL_FILE_NAME, keep_history=True):
+    """
+    Writes the fill report files: the CO format pull, every block as CSV and Parquet, and
+    a snapshot in the fill history. Returns the paths written.
+    """
+    blocks, co_format = fill_tables(table)
+    os.makedirs(out_dir, exist_ok=True)
+
+    csv_path_1 = os.path.join(out_dir, "CO_Format_Pull.csv")
+    csv_path_2 = os.path.join(out_dir, f"{file_name}.csv")
+    parquet_path = os.path.join(out_dir, f"{file_name}.parquet")
+    pacsv.write_csv(decode_dictionaries(co_format), csv_path_1)
+    pacsv.write_csv(decode_dictionaries(blocks), csv_path_2)
+    pq.write_table(blocks, parquet_path)
+    paths = [csv_path_1, csv_path_2, parquet_path]
+
+    if keep_history:
+        # Keep every pull as a snapshot instead of losing it on the next overwrite
+        from history import HistoryStore
+        history_path = os.path.join(out_dir, f"{file_name}_history")
+        with HistoryStore(history_path, station_column="Station", slice_keys=["Station"],
+                          retention_days=HISTORY_RETENTION_DAYS) as history:
+            history.append(blocks)
+        paths.append(history_path)
+
+    logger.info(f"Fill report: {blocks.num_rows} blocks, {co_format.num_rows} pending, saved to {out_dir}")
+    return paths
+
+
+async def main(date=None, site_filters=None, out_dir=FILL_DIR, file_name=FILL_FILE_NAME):
+    scraper = FillScraper(date=date)
+    jar = Cookies(FILL_URL).get_jar()
+    sites = scraper.get_sites(**(site_filters if site_filters is not None else {"prefix": "D"}))
+    table = await pull_fill(sites, jar, scraper=scraper)
+    return save_fill_report(table, out_dir, file_name, keep_history=KEEP_HISTORY)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,207 @@
+import os
+import glob
+import time
+import shutil
+import logging
+from datetime import datetime, timedelta
+
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+from normalize import decode_dictionaries
+
+logger = logging.getLogger(__name__)
+
+
+class HistoryStore:
+    """
+    Append-only Parquet dataset of scraped snapshots.
+
+    Every run's rows are stamped with run_ts, buffered, and written as a single file
+    under root/scrape_date=YYYY-MM-DD/ when the run is flushed, sorted by station so
+    station filters can skip row groups. Nothing is ever overwritten, reads only list
+    the days they need, and finished days are compacted into one file.
+
+    A snapshot resolves each slice (slice_keys, e.g. station/area/date) to its newest
+    run at or before a point in time, which also stitches delta runs that only wrote
+    the slices that changed. A slice that became empty is written as a tombstone row
+    (removed=True), which supersedes its older rows and is left out of snapshots.
+
+    Args:
+        retention_days: scrape_date partitions older than this are deleted on flush;
+            None keeps everything.
+    """
+
+    def __init__(self, root, station_column="station", slice_keys=("station", "area_id", "date"), run_ts=None,
+                 retention_days=None):
+        self.root = root
+        self.station_column = station_column
+        self.slice_keys = list(slice_keys)
+        run_ts = run_ts or datetime.now()
+        # Millisecond precision, so back-to-back runs never share a run_ts
+        self.run_ts = run_ts.replace(microsecond=run_ts.microsecond // 1000 * 1000)
+        self.retention_days = retention_days
+        self.partitioning = ds.partitioning(pa.schema([("scrape_date", pa.string())]), flavor="hive")
+        self._buffer = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.flush()
+
+    def append(self, table):
+        """
+        Adds rows of the current run. Accepts a pyarrow Table or a pandas DataFrame.
+
+        Rows are held until flush(), so a run becomes one file however many sites it has.
+        """
+        if not isinstance(table, pa.Table):
+            table = pa.Table.from_pandas(table, preserve_index=False)
+        if not table.num_rows:
+            return 0
+
+        # Plain column types keep the schema identical across every file in the dataset
+        self._buffer.append(self._stamp(decode_dictionaries(table), removed=False))
+        return table.num_rows
+
+    def remove(self, slices):
+        """
+        Records slices as empty in the current run, e.g. when all their blocks were withdrawn.
+
+        slices is a table or list of dicts with the slice_keys columns.
+        """
+        if not isinstance(slices, pa.Table):
+            slices = pa.Table.from_pylist(list(slices))
+        if not slices.num_rows:
+            return 0
+        self._buffer.append(self._stamp(decode_dictionaries(slices.select(self.slice_keys)), removed=True))
+        return slices.num_rows
+
+    def _stamp(self, table, removed):
+        table = table.append_column("removed", pa.array([removed] * table.num_rows, pa.bool_()))
+        return table.append_column("run_ts", pa.array([self.run_ts] * table.num_rows, pa.timestamp("ms")))
+
+    def flush(self):
+        """Writes the buffered rows of this run as one file, then applies retention and compaction."""
+        if not self._buffer:
+            return 0
+        table = pa.concat_tables(self._buffer, promote_options="default").sort_by(self.station_column)
+        self._buffer = []
+
+        directory = self._day_dir(self.run_ts.strftime("%Y-%m-%d"))
+        os.makedirs(directory, exist_ok=True)
+        name = f"run-{int(self.run_ts.timestamp() * 1000)}-{os.getpid()}.parquet"
+        tmp_path = os.path.join(directory, f".{name}.tmp")
+        pq.write_table(table, tmp_path, row_group_size=64 * 1024)
+        os.replace(tmp_path, os.path.join(directory, name))
+
+        self.maintain()
+        return table.num_rows
+
+    def maintain(self, today=None):
+        """Deletes days past the retention and merges each finished day's run files into one."""
+        today = today or datetime.now().strftime("%Y-%m-%d")
+        lock_path = os.path.join(self.root, ".maintain.lock")
+        if os.path.exists(lock_path) and time.time() - os.path.getmtime(lock_path) > 60 * 60:
+            os.remove(lock_path)  # Left behind by a killed process
+        try:
+            # Shards flush at the same time; only one of them tidies up
+            os.close(os.open(lock_path, os.O_CREAT | os.O_EXCL))
+        except FileExistsError:
+            return
+        try:
+            if self.retention_days is not None:
+                oldest = datetime.strptime(today, "%Y-%m-%d") - timedelta(days=self.retention_days)
+                for day in self.days():
+                    if day < oldest.strftime("%Y-%m-%d"):
+                        shutil.rmtree(self._day_dir(day), ignore_errors=True)
+                        logger.info(f"Removed history for {day}, past the {self.retention_days} day retention")
+
+            for day in self.days():
+                if day < today:
+                    self.compact(day)
+        finally:
+            os.remove(lock_path)
+
+    def compact(self, day):
+        """Merges the run files of one scrape_date into a single file, streaming one file at a time."""
+        files = self._files([day])
+        if len(files) < 2:
+            return
+        directory = self._day_dir(day)
+        tmp_path = os.path.join(directory, ".compacted.parquet.tmp")
+        schema = self._schema(files)
+        with pq.ParquetWriter(tmp_path, schema) as out:
+            for path in files:
+                out.write_table(pq.read_table(path, schema=schema), row_group_size=64 * 1024)
+        os.replace(tmp_path, os.path.join(directory, f"compacted-{os.path.basename(files[-1])}"))
+        for path in files:
+            os.remove(path)
+        logger.info(f"Compacted {len(files)} history files for {day}")
+
+    def _day_dir(self, day):
+        return os.path.join(self.root, f"scrape_date={day}")
+
+    def days(self):
+        """scrape_date partitions present, oldest first."""
+        prefix = os.path.join(self.root, "scrape_date=")
+        return sorted(path[len(prefix):] for path in glob.glob(f"{glob.escape(prefix)}*") if os.path.isdir(path))
+
+    def _files(self, days):
+        files = []
+        for day in days:
+            files.extend(sorted(glob.glob(os.path.join(glob.escape(self._day_dir(day)), "*.parquet"))))
+        return files
+
+    @staticmethod
+    def _schema(files):
+        # Files may predate a column (e.g. removed), so the schema is unified over all of them
+        return pa.unify_schemas([pq.read_schema(path) for path in files], promote_options="permissive")
+
+    def dataset(self, days=None):
+        """The history as a dataset, optionally only the given scrape_date partitions."""
+        files = self._files(self.days() if days is None else days)
+        schema = self._schema(files) if files else None
+        return ds.dataset(files, schema=schema, format="parquet", partitioning=self.partitioning,
+                          partition_base_dir=self.root)
+
+    def snapshot(self, as_of=None, stations=None, lookback_days=28, columns=None):
+        """
+        Returns the newest version of every slice as of a point in time.
+
+        Args:
+            as_of: datetime to read as of, defaults to now.
+            stations: Only these stations.
+            lookback_days: Oldest scrape_date partition read, relative to as_of.
+            columns: Columns to return, defaults to all.
+        """
+        as_of = as_of or datetime.now()
+        first, last = (as_of - timedelta(days=lookback_days)).strftime("%Y-%m-%d"), as_of.strftime("%Y-%m-%d")
+        days = [day for day in self.days() if first <= day <= last]
+        if not days:
+            return pa.table({})
+
+        condition = ds.field("run_ts") <= pa.scalar(as_of, pa.timestamp("ms"))
+        if stations is not None:
+            condition = condition & ds.field(self.station_column).isin(list(stations))
+
+        table = self.dataset(days).to_table(filter=condition)
+        if not table.num_rows:
+            return table
+
+        latest = table.group_by(self.slice_keys).aggregate([("run_ts", "max")])
+        table = table.join(
+            latest, keys=self.slice_keys + ["run_ts"], right_keys=self.slice_keys + ["run_ts_max"], join_type="inner"
+        )
+        if "removed" in table.column_names:
+            table = table.filter(pc.invert(pc.fill_null(table["removed"], False))).drop_columns(["removed"])
+        if columns is not None:
+            table = table.select(columns)
+        return table
+
+    def latest(self, stations=None, columns=None, lookback_days=28):
+        """Newest version of every slice scraped in the last lookback_days."""
+        return self.snapshot(stations=stations, columns=columns, lookback_days=lookback_days)
@@ -0,0 +1,176 @@
+import os
+import json
+import zlib
+import time
+import sqlite3
+import asyncio
+import logging
+from datetime import date
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+
+class RunLedger:
+    """
+    Durable checkpoint of a scrape run in SQLite.
+
+    Every demand request (service area plus a chunk of dates) is a unit, recorded as
+    done with its payload or failed as soon as it finishes. A resumed run replays the
+    stored payloads and only scrapes the dates still missing. A run can only be resumed
+    on the day it started, since the date window moves with the day.
+
+    Units recorded from a running scrape go through record_async, which encodes,
+    compresses and commits on a single writer thread, off the event loop.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        # Shared with the writer thread; it runs one statement at a time, and only while a scrape is running
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="ledger")
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript("""
+            CREATE TABLE IF NOT EXISTS runs (
+                run_id TEXT PRIMARY KEY,
+                started REAL NOT NULL,
+                dates TEXT NOT NULL,
+                finished REAL
+            );
+            CREATE TABLE IF NOT EXISTS units (
+                run_id TEXT NOT NULL,
+                area_id TEXT NOT NULL,
+                dates TEXT NOT NULL,
+                status TEXT NOT NULL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                payload BLOB,
+                updated REAL NOT NULL,
+                PRIMARY KEY (run_id, area_id, dates)
+            );
+        """)
+        self.conn.commit()
+        self.run_id = None
+        self.dates = None
+
+    def close(self):
+        self._executor.shutdown()
+        self.conn.close()
+
+    def start(self, dates, resume=False):
+        """
+        Starts a new run over dates, or picks up today's unfinished run if resuming.
+
+        Returns the date window of the run, which for a resumed run is the one it
+        started with.
+        """
+        if resume:
+            row = self.conn.execute(
+                "SELECT run_id, dates FROM runs WHERE finished IS NULL ORDER BY started DESC LIMIT 1"
+            ).fetchone()
+            if row is not None and json.loads(row[1])[0] == date.today().isoformat():
+                self.run_id, self.dates = row[0], json.loads(row[1])
+                done, failed = self.conn.execute(
+                    "SELECT SUM(status = 'done'), SUM(status = 'failed') FROM units WHERE run_id = ?", (self.run_id,)
+                ).fetchone()
+                logger.info(f"Resuming run {self.run_id}: {done or 0} units done, {failed or 0} failed")
+                return self.dates
+            logger.info("No unfinished run from today to resume, starting a new one")
+
+        self.run_id = time.strftime("%Y%m%dT%H%M%S")
+        self.dates = list(dates)
+        self.conn.execute(
+            "INSERT OR REPLACE INTO runs (run_id, started, dates) VALUES (?, ?, ?)",
+            (self.run_id, time.time(), json.dumps(self.dates))
+        )
+        self.conn.execute("DELETE FROM units WHERE run_id = ?", (self.run_id,))
+        self.conn.commit()
+        return self.dates
+
+    def record(self, area_id, dates, data, attempts=1):
+        """Marks a unit done with its payload, or failed if data is None."""
+        payload = None if data is None else zlib.compress(json.dumps(data, separators=(",", ":")).encode())
+        self.conn.execute(
+            """
+            INSERT INTO units (run_id, area_id, dates, status, attempts, payload, updated)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT (run_id, area_id, dates) DO UPDATE SET
+                status = excluded.status,
+                attempts = units.attempts + excluded.attempts,
+                payload = COALESCE(excluded.payload, units.payload),
+                updated = excluded.updated
+            """,
+            (self.run_id, area_id, json.dumps(dates), "failed" if data is None else "done", attempts, payload, time.time())
+        )
+        self.conn.commit()
+
+    async def record_async(self, area_id, dates, data, attempts=1):
+        """record() on the ledger's writer thread, so the event loop keeps serving requests."""
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(self._executor, self.record, area_id, dates, data, attempts)
+
+    def completed(self):
+        """{area_id: [(dates, compressed payload), ...]} for every unit already done in this run."""
+        completed = {}
+        rows = self.conn.execute(
+            "SELECT area_id, dates, payload FROM units WHERE run_id = ? AND status = 'done' AND payload IS NOT NULL",
+            (self.run_id,)
+        )
+        for area_id, dates, payload in rows:
+            completed.setdefault(area_id, []).append((json.loads(dates), payload))
+        return completed
+
+    def plan(self, sites, writer=None):
+        """
+        Splits sites into what is still to scrape, replaying what is already done.
+
+        Stored payloads are written to the writer and its history: the interrupted run
+        never flushed its history, and a replay of a slice that did reach it is resolved
+        to one version by run_ts. Returns copies of the sites still missing dates,
+        carrying only those dates under "dates".
+        """
+        completed = self.completed()
+        pending, replayed = [], 0
+        for site in sites:
+            units = completed.get(site["area_id"], [])
+            done = {d for dates, _ in units for d in dates}
+            if writer is not None and units:
+                payload = {}
+                for _, blob in units:
+                    payload.update(json.loads(zlib.decompress(blob)))
+                writer.write(site, payload)
+                replayed += 1
+
+            missing = [d for d in site.get("dates", self.dates) if d not in done]
+            if missing:
+                pending.append({**site, "dates": missing})
+
+        logger.info(f"{replayed} sites replayed from the ledger, {len(pending)}/{len(sites)} still to scrape")
+        return pending
+
+    def finish(self):
+        """
+        Closes the run if every unit is done, dropping payloads that are no longer needed.
+
+        Returns False, leaving the run resumable, if any failed unit's dates were not
+        scraped by a later unit.
+        """
+        done, failed = {}, 0
+        rows = self.conn.execute("SELECT area_id, dates, status FROM units WHERE run_id = ?", (self.run_id,)).fetchall()
+        for area_id, dates, status in rows:
+            if status == "done":
+                done.setdefault(area_id, set()).update(json.loads(dates))
+        for area_id, dates, status in rows:
+            if status == "failed" and not set(json.loads(dates)) <= done.get(area_id, set()):
+                failed += 1
+        if failed:
+            logger.warning(f"{failed} units failed; resume the run to retry them")
+            return False
+
+        self.conn.execute("UPDATE runs SET finished = ? WHERE run_id = ?", (time.time(), self.run_id))
+        self.conn.execute("DELETE FROM units WHERE run_id != ?", (self.run_id,))
+        self.conn.execute("DELETE FROM runs WHERE run_id != ?", (self.run_id,))
+        self.conn.execute("UPDATE units SET payload = NULL WHERE run_id = ?", (self.run_id,))
+        self.conn.commit()
+        return True
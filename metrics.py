@@ -0,0 +1,135 @@
+import os
+import json
+import bisect
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+LATENCY_BUCKETS = [0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60]
+
+
+class Histogram:
+    """Cumulative-bucket histogram in the Prometheus style."""
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = list(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, q):
+        """Upper bound of the bucket holding the q-th quantile."""
+        if not self.count:
+            return 0.0
+        rank, seen = q * self.count, 0
+        for bound, count in zip(self.buckets + [float("inf")], self.counts):
+            seen += count
+            if seen >= rank:
+                return bound
+        return float("inf")
+
+
+class Metrics:
+    """
+    Process-wide counters and latency histograms, keyed by name and labels.
+
+    Exported at the end of a run as Prometheus text (.prom/.txt) or a JSON summary.
+    """
+
+    def __init__(self):
+        self.counters = {}
+        self.histograms = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(name, labels):
+        return name, tuple(sorted(labels.items()))
+
+    def inc(self, name, value=1, **labels):
+        key = self._key(name, labels)
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, name, value, **labels):
+        key = self._key(name, labels)
+        with self._lock:
+            if key not in self.histograms:
+                self.histograms[key] = Histogram()
+            self.histograms[key].observe(value)
+
+    def reset(self):
+        with self._lock:
+            self.counters, self.histograms = {}, {}
+
+    @staticmethod
+    def _labels(labels, extra=()):
+        pairs = list(labels) + list(extra)
+        if not pairs:
+            return ""
+        return "{" + ",".join(f'{k}="{v}"' for k, v in pairs) + "}"
+
+    def to_prometheus(self):
+        lines = []
+        for (name, labels), value in sorted(self.counters.items()):
+            lines.append(f"{name}{self._labels(labels)} {value}")
+        for (name, labels), hist in sorted(self.histograms.items(), key=lambda item: item[0]):
+            cumulative = 0
+            for bound, count in zip(hist.buckets + ["+Inf"], hist.counts):
+                cumulative += count
+                lines.append(f"{name}_bucket{self._labels(labels, [('le', bound)])} {cumulative}")
+            lines.append(f"{name}_sum{self._labels(labels)} {hist.sum}")
+            lines.append(f"{name}_count{self._labels(labels)} {hist.count}")
+        return "\n".join(lines) + "\n"
+
+    def to_json(self):
+        def label_str(name, labels):
+            return name + self._labels(labels)
+
+        return {
+            "counters": {label_str(name, labels): value for (name, labels), value in sorted(self.counters.items())},
+            "histograms": {
+                label_str(name, labels): {
+                    "count": hist.count,
+                    "sum": hist.sum,
+                    "mean": hist.sum / hist.count if hist.count else 0.0,
+                    "p50": hist.quantile(0.5),
+                    "p95": hist.quantile(0.95),
+                    "p99": hist.quantile(0.99),
+                }
+                for (name, labels), hist in sorted(self.histograms.items(), key=lambda item: item[0])
+            },
+        }
+
+    def write(self, path):
+        """Writes Prometheus text for .prom/.txt paths and a JSON summary otherwise."""
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with open(path, "w") as f:
+            if path.endswith((".prom", ".txt")):
+                f.write(self.to_prometheus())
+            else:
+                json.dump(self.to_json(), f, indent=2, default=str)
+        logger.info(f"Metrics written to {path}")
+
+
+class SampledLogger:
+    """Logs only every Nth message, so per-item logging stays cheap on the hot path."""
+
+    def __init__(self, logger, every=100):
+        self.logger = logger
+        self.every = max(1, every)
+        self.calls = 0
+
+    def debug(self, msg, *args):
+        self.calls += 1
+        if self.calls % self.every == 1 or self.every == 1:
+            if self.logger.isEnabledFor(logging.DEBUG):
+                self.logger.debug(msg, *args)
+
+
+METRICS = Metrics()
@@ -0,0 +1,82 @@
+import pyarrow as pa
+
+CATEGORY = pa.dictionary(pa.int32(), pa.string())
+
+# Fields kept from each demand block, with their column types
+DEMAND_FIELDS = {
+    "startTime": pa.timestamp("ms"),  # int64 epoch milliseconds
+    "durationInMinutes": pa.int32(),
+    "requiredQuantity": pa.int64(),
+    "scheduledQuantity": pa.int64(),
+    "waveGroupId": CATEGORY,
+    "capacityType": CATEGORY,
+}
+
+DEMAND_SCHEMA = pa.schema(
+    [("station", CATEGORY), ("area_id", pa.string()), ("date", CATEGORY)]
+    + [(name, dtype) for name, dtype in DEMAND_FIELDS.items()]
+)
+
+
+def plain_schema(schema):
+    """The schema with dictionary (categorical) fields replaced by their value type."""
+    return pa.schema([
+        pa.field(f.name, f.type.value_type) if pa.types.is_dictionary(f.type) else f for f in schema
+    ])
+
+
+def decode_dictionaries(table):
+    """The table with every dictionary column decoded to plain values, e.g. for CSV."""
+    return table.cast(plain_schema(table.schema))
+
+
+def _constant(value, length, dtype):
+    """A column repeating one value, stored once as a dictionary entry where possible."""
+    if pa.types.is_dictionary(dtype):
+        return pa.DictionaryArray.from_arrays(pa.array([0] * length, pa.int32()), pa.array([value], pa.string()))
+    return pa.array([value] * length, dtype)
+
+
+def _column(values, dtype):
+    if pa.types.is_dictionary(dtype):
+        return pa.array(values, pa.string()).dictionary_encode()
+    if pa.types.is_timestamp(dtype):
+        return pa.array(values, pa.int64()).cast(dtype)
+    return pa.array(values, dtype)
+
+
+def normalize(site, payload, capacity_type="CSP", fields=None):
+    """
+    Builds a typed column table straight from one site's response.
+
+    Blocks of other capacity types are skipped and only the requested fields are read,
+    so no per-row objects are created and cost scales with the columns kept.
+
+    Args:
+        site: Site mapping the payload was scraped for.
+        payload: Response of the shape {date: [records]}.
+        capacity_type: Only blocks of this capacity type are kept.
+        fields: Subset of DEMAND_FIELDS to keep, defaults to all of them.
+    """
+    fields = list(fields or DEMAND_FIELDS)
+    columns = {name: [] for name in fields}
+    date_index, date_values = [], []
+
+    for date, records in payload.items():
+        kept = [record for record in records if record.get("capacityType") == capacity_type]
+        if not kept:
+            continue
+        date_index.extend([len(date_values)] * len(kept))
+        date_values.append(date)
+        for name in fields:
+            columns[name].extend([record.get(name) for record in kept])
+
+    length = len(date_index)
+    arrays = [
+        _constant(str(site.get("station")), length, CATEGORY),
+        _constant(str(site.get("area_id")), length, pa.string()),
+        pa.DictionaryArray.from_arrays(pa.array(date_index, pa.int32()), pa.array(date_values, pa.string())),
+    ] + [_column(columns[name], DEMAND_FIELDS[name]) for name in fields]
+
+    schema = pa.schema([DEMAND_SCHEMA.field(name) for name in ["station", "area_id", "date"] + fields])
+    return pa.Table.from_arrays(arrays, schema=schema)
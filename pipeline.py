@@ -0,0 +1,200 @@
+import os
+import sys
+import time
+import asyncio
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from config import *
+from cookie_scrape import Cookies
+from site_scrape import SiteScraper
+from concurrency import AdaptiveLimiter
+from normalize import normalize
+from writer import DemandWriter
+from export import UploadFileWriter, check_uploadable
+from uploader import HttpUploader
+from upload_status import StatusPoller
+from metrics import METRICS
+
+logger = logging.getLogger(__name__)
+
+
+class Pipeline:
+    """
+    Scrape -> transform -> upload -> verify, running as one async pipeline.
+
+    Stages are connected by bounded queues: sites are normalized into upload files as
+    they arrive, each part is uploaded as soon as it is closed, and its processing
+    status is polled while later parts are still being scraped and uploaded. Every
+    stage shares one cookie jar.
+
+    Args:
+        upload_types: Upload types to build, see EXPORT_LAYOUTS.
+        output: Optional path the scraped demand is also written to, like a plain scrape.
+        part_rows: Rows per upload part, so the first upload starts early; parts are
+            also capped at max_bytes.
+    """
+
+    def __init__(self, scraper=None, upload_types=None, output=None, out_dir=EXPORT_DIR, max_bytes=EXPORT_MAX_BYTES,
+                 part_rows=PIPELINE_PART_ROWS, upload_workers=UPLOAD_WORKERS, queue_size=PIPELINE_QUEUE_SIZE,
+                 status_timeout=300):
+        if not upload_types:
+            raise ValueError("Pipeline needs the upload types to build and upload")
+        check_uploadable(upload_types)
+        if UPLOAD_MODE != "http":
+            raise ValueError('Pipeline posts parts over HTTP; set UPLOAD_MODE = "http" once the upload endpoint is confirmed')
+        self.scraper = scraper or SiteScraper(SUI_URL, num_days=FORECAST_DAYS)
+        self.upload_types = list(upload_types)
+        self.output = output
+        self.out_dir = out_dir
+        self.max_bytes = max_bytes
+        self.part_rows = part_rows
+        self.upload_workers = upload_workers
+        self.queue_size = queue_size
+        self.status_timeout = status_timeout
+        self.results = []
+        self._started = None
+
+    def _elapsed(self):
+        return time.monotonic() - self._started
+
+    async def transform(self, scraped, parts):
+        """Normalizes scraped sites into upload files, queueing each part once it is closed."""
+        history = None
+        if KEEP_HISTORY and self.output:
+            from history import HistoryStore
+            history = HistoryStore(HISTORY_DIR, retention_days=HISTORY_RETENTION_DAYS)
+
+        writers = [
+            UploadFileWriter(upload_type, EXPORT_LAYOUTS[upload_type], self.out_dir, self.max_bytes,
+                             max_rows=self.part_rows)
+            for upload_type in self.upload_types
+        ]
+        queued = {writer.upload_type: 0 for writer in writers}
+
+        async def flush():
+            for writer in writers:
+                for path in writer.finished[queued[writer.upload_type]:]:
+                    await parts.put((writer.upload_type, path))
+                queued[writer.upload_type] = len(writer.finished)
+
+        with DemandWriter(self.output, capacity_type="CSP", history=history) as output:
+            try:
+                while True:
+                    item = await scraped.get()
+                    if item is None:
+                        break
+                    site, payload = item
+                    try:
+                        table = normalize(site, payload, capacity_type="CSP")
+                    except Exception as e:
+                        # One malformed response loses that site, not the whole pipeline
+                        logger.error(f"Failed to normalize site data {site['station']}: {e!r}")
+                        continue
+                    if self.output or history is not None:
+                        output.write_table(table)
+                    for writer in writers:
+                        writer.write(table)
+                    await flush()
+            except BaseException:
+                for writer in writers:
+                    writer.close(discard=True)
+                raise
+
+        for writer in writers:
+            writer.close()
+        await flush()
+
+    async def upload(self, lane, http, poller, executor):
+        """Uploads parts from one lane's queue in order and starts tracking their status."""
+        loop = asyncio.get_running_loop()
+        while True:
+            item = await lane.get()
+            if item is None:
+                return
+            upload_type, path = item
+            submitted_at = datetime.now()
+            success = await loop.run_in_executor(executor, http.upload_file, upload_type, path)
+            result = {"type": upload_type, "file": path, "success": success, "status": None}
+            if success:
+                METRICS.observe("pipeline_time_to_upload_seconds", self._elapsed())
+                logger.info(f"Uploaded {os.path.basename(path)} {self._elapsed():.1f}s after the start")
+                result["future"] = poller.track(upload_type, os.path.basename(path), submitted_at)
+            self.results.append(result)
+
+    async def route(self, parts, lanes, shared):
+        """Sends ordered upload types to their own sequential lane, the rest to the shared workers."""
+        while True:
+            item = await parts.get()
+            if item is None:
+                break
+            await lanes.get(item[0], shared).put(item)
+        for lane in lanes.values():
+            await lane.put(None)
+        for _ in range(self.upload_workers):
+            await shared.put(None)
+
+    async def run(self, sites, cookies=None):
+        """
+        Runs every stage to completion. Returns one result per upload part, with the
+        final status record of accepted parts under "status".
+        """
+        self._started = time.monotonic()
+        self.results = []
+        jar = cookies or Cookies(SUI_URL).get_jar()
+
+        scraped = asyncio.Queue(maxsize=self.queue_size)
+        parts = asyncio.Queue(maxsize=self.queue_size)
+        shared = asyncio.Queue(maxsize=self.queue_size)
+        lanes = {t: asyncio.Queue(maxsize=self.queue_size) for t in self.upload_types if t in ORDERED_UPLOAD_TYPES}
+
+        limiter = AdaptiveLimiter(initial=MAX_CONCURRENT, max_limit=MAX_CONCURRENT_LIMIT)
+        http = HttpUploader(jar, pool_size=max(8, self.upload_workers + len(lanes)))
+        executor = ThreadPoolExecutor(max_workers=self.upload_workers + len(lanes))
+        session = self.scraper.open_session(jar)
+
+        # End-of-stream markers are only sent on success; a failing stage cancels the others
+        async def scrape():
+            scraped_sites = await self.scraper.dispatch(session, sites, limiter, queue=scraped)
+            logger.info(f"Scraped {scraped_sites}/{len(sites)} sites in {self._elapsed():.1f}s")
+            await scraped.put(None)
+
+        async def transform():
+            await self.transform(scraped, parts)
+            await parts.put(None)
+
+        try:
+            async with session, StatusPoller(jar, timeout=self.status_timeout) as poller:
+                async with asyncio.TaskGroup() as group:
+                    group.create_task(scrape())
+                    group.create_task(transform())
+                    group.create_task(self.route(parts, lanes, shared))
+                    for lane in lanes.values():
+                        group.create_task(self.upload(lane, http, poller, executor))
+                    for _ in range(self.upload_workers):
+                        group.create_task(self.upload(shared, http, poller, executor))
+
+                for result in self.results:
+                    future = result.pop("future", None)
+                    if future is not None:
+                        result["status"] = await future
+                jar.sync_from_aiohttp(session.cookie_jar)
+        finally:
+            executor.shutdown(wait=False)
+            http.close()
+            self.scraper.save_cache()
+            METRICS.write(METRICS_PATH)
+
+        logger.info(f"Pipeline finished in {self._elapsed():.1f}s: {len(self.results)} parts uploaded")
+        return self.results
+
+
+async def main(upload_types=None, output=None, site_filters=None):
+    pipeline = Pipeline(upload_types=upload_types, output=output)
+    sites = pipeline.scraper.get_sites(**(site_filters if site_filters is not None else {"prefix": "D"}))
+    return await pipeline.run(sites)
+
+
+if __name__ == "__main__":
+    # Upload types to build and upload, e.g. python pipeline.py Demand
+    asyncio.run(main(upload_types=sys.argv[1:]))
@@ -0,0 +1,60 @@
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def stitch(chunks):
+    """Merges per-chunk responses of the shape {date: [records]} back into one payload."""
+    payload = {}
+    for chunk in chunks:
+        if chunk:
+            payload.update(chunk)
+    return payload
+
+
+class RequestPlanner:
+    """
+    Decides how each service area's date window is split into demand requests.
+
+    With a fixed chunk_days every window is cut into chunks of that many dates;
+    chunk_days=None sends the whole window in one request. In adaptive mode the chunk
+    size is re-derived from the measured time and bytes per date, so requests land
+    near target_latency seconds and under max_bytes.
+    """
+
+    def __init__(self, chunk_days=None, adaptive=False, target_latency=2.0, max_bytes=None, min_days=1, max_days=28):
+        self.chunk_days = chunk_days
+        self.adaptive = adaptive
+        self.target_latency = target_latency
+        self.max_bytes = max_bytes
+        self.min_days = min_days
+        self.max_days = max_days
+        self.seconds_per_date = None
+        self.bytes_per_date = None
+
+    def chunk_size(self, num_dates):
+        """Number of dates to send per request for a window of num_dates."""
+        if not self.adaptive or self.seconds_per_date is None:
+            return self.chunk_days or num_dates
+
+        size = self.target_latency / max(self.seconds_per_date, 1e-6)
+        if self.max_bytes and self.bytes_per_date:
+            size = min(size, self.max_bytes / self.bytes_per_date)
+        return int(max(self.min_days, min(self.max_days, size)))
+
+    def plan(self, dates):
+        """Splits a date window into the list of date chunks to request."""
+        size = max(1, self.chunk_size(len(dates)))
+        return [dates[i:i + size] for i in range(0, len(dates), size)]
+
+    def observe(self, num_dates, latency, nbytes):
+        """Feeds one response's latency and size back into the adaptive estimates."""
+        if not num_dates:
+            return
+        spd, bpd = latency / num_dates, nbytes / num_dates
+        if self.seconds_per_date is None:
+            self.seconds_per_date, self.bytes_per_date = spd, bpd
+        else:
+            self.seconds_per_date = 0.8 * self.seconds_per_date + 0.2 * spd
+            self.bytes_per_date = 0.8 * self.bytes_per_date + 0.2 * bpd
+        logger.debug(f"Planner: {self.seconds_per_date:.3f}s and {self.bytes_per_date:.0f}B per date")
@@ -0,0 +1,131 @@
+import os
+import json
+import time
+import logging
+from datetime import date as date_cls
+
+logger = logging.getLogger(__name__)
+
+# Seconds a slice may be early and still count as due, for timer and clock jitter between runs
+DUE_TOLERANCE = 5
+
+
+class RefreshScheduler:
+    """
+    Gives every (area, date) slice its own refresh cadence.
+
+    The base cadence comes from the slice's forecast horizon, e.g. today and tomorrow
+    every few minutes and days 3-7 hourly. In adaptive mode a slice that keeps coming
+    back unchanged doubles its interval (up to max_factor times the base), and falls
+    back to the base as soon as it changes.
+
+    Args:
+        tiers: List of (first_offset, last_offset, seconds) by days from today; the last
+            tier also covers every later date.
+        path: Optional JSON file the schedule is persisted to between runs.
+    """
+
+    def __init__(self, tiers, path=None, adaptive=True, max_factor=8):
+        self.tiers = sorted(tiers)
+        self.path = path
+        self.adaptive = adaptive
+        self.max_factor = max_factor
+        self.slices = {}
+        self.planned_at = None
+        if path:
+            self.load()
+
+    def load(self):
+        try:
+            with open(self.path, "r") as f:
+                self.slices = json.load(f)
+        except FileNotFoundError:
+            self.slices = {}
+        except Exception as e:
+            logger.warning(f"Ignoring unreadable refresh schedule {self.path}: {e}")
+            self.slices = {}
+
+    def save(self):
+        if not self.path:
+            return
+        # Forget slices whose date has passed
+        today = date_cls.today().isoformat()
+        self.slices = {k: v for k, v in self.slices.items() if k.split("|", 1)[1] >= today}
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(self.slices, f)
+        os.replace(tmp_path, self.path)
+
+    def base_interval(self, date):
+        """Refresh interval in seconds for a date, from its horizon tier."""
+        offset = (date_cls.fromisoformat(date) - date_cls.today()).days
+        for first, last, seconds in self.tiers:
+            if first <= offset <= last:
+                return seconds
+        return self.tiers[-1][2]
+
+    @property
+    def min_interval(self):
+        """Shortest base interval of any tier."""
+        return min(seconds for _, _, seconds in self.tiers)
+
+    def due_in(self, area_id, date, now=None):
+        """Seconds until a slice is due for a refresh, 0 if it already is."""
+        now = now or time.time()
+        state = self.slices.get(f"{area_id}|{date}")
+        if state is None:
+            return 0.0
+        wait = state["last"] + state.get("interval", self.base_interval(date)) - now
+        return 0.0 if wait <= DUE_TOLERANCE else wait
+
+    def due_dates(self, area_id, dates, now=None):
+        """The subset of dates whose slice for this area is due for a refresh."""
+        return [date for date in dates if not self.due_in(area_id, date, now)]
+
+    def next_due(self, sites, dates, now=None):
+        """Seconds until the first slice of these sites is due, 0 if one already is."""
+        now = now or time.time()
+        return min((self.due_in(site["area_id"], date, now) for site in sites for date in dates), default=0.0)
+
+    def plan(self, sites, dates, now=None):
+        """
+        Returns copies of the sites carrying only their due dates under "dates".
+
+        Sites with nothing due are left out. Slices recorded afterwards are stamped
+        with the planning time, so they fall due a whole interval after the run
+        started rather than after their response arrived.
+        """
+        now = now or time.time()
+        self.planned_at = now
+        planned = []
+        for site in sites:
+            due = self.due_dates(site["area_id"], dates, now)
+            if due:
+                planned.append({**site, "dates": due})
+        logger.info(f"{len(planned)}/{len(sites)} sites have slices due for refresh")
+        return planned
+
+    def record(self, area_id, dates, changed=None, now=None):
+        """
+        Marks slices as refreshed.
+
+        Args:
+            changed: Dates whose content changed; None when unknown, which keeps the
+                base cadence.
+            now: Refresh time, by default when the current run was planned.
+        """
+        now = now or self.planned_at or time.time()
+        for date in dates:
+            key = f"{area_id}|{date}"
+            base = self.base_interval(date)
+            state = self.slices.get(key, {"interval": base, "unchanged": 0})
+
+            if not self.adaptive or changed is None or date in changed:
+                state = {"interval": base, "unchanged": 0}
+            else:
+                state["unchanged"] = state.get("unchanged", 0) + 1
+                state["interval"] = min(base * self.max_factor, state.get("interval", base) * 2)
+
+            state["last"] = now
+            self.slices[key] = state
@@ -0,0 +1,122 @@
+import os
+import json
+import hashlib
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class ResponseCache:
+    """
+    Local cache of demand responses keyed by service area and date.
+
+    Stores a content hash per (serviceAreaId, date) slice plus any ETag/Last-Modified
+    validators the server returned, so repeat scrapes can ask for conditional responses
+    and drop slices that have not changed since the last run.
+
+    New hashes and validators are held per service area and only kept on save() if
+    every station of the area was written, so slices a writer rejected count as
+    changed again next run.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.hashes = {}
+        self.validators = {}
+        self.pending = {}
+        self.written = set()
+        self.failed = set()
+        self.hits = 0
+        self.misses = 0
+        self.load()
+
+    def load(self):
+        """Loads the cache from disk, starting empty if it is missing or unreadable."""
+        try:
+            with open(self.path, "r") as f:
+                cached = json.load(f)
+            self.hashes = cached.get("hashes", {})
+            self.validators = cached.get("validators", {})
+            logger.info(f"Loaded {len(self.hashes)} cached slices from {self.path}")
+        except FileNotFoundError:
+            logger.info("No response cache found, starting fresh")
+        except Exception as e:
+            logger.warning(f"Ignoring unreadable response cache {self.path}: {e}")
+
+    def save(self):
+        """Writes the cache atomically so an interrupted run cannot corrupt it."""
+        for area_id in self.written - self.failed:
+            hashes, validators = self.pending.get(area_id, ({}, {}))
+            self.hashes.update(hashes)
+            self.validators.update(validators)
+        self.pending, self.written, self.failed = {}, set(), set()
+
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({"hashes": self.hashes, "validators": self.validators}, f)
+        os.replace(tmp_path, self.path)
+
+    @staticmethod
+    def slice_key(area_id, date):
+        return f"{area_id}|{date}"
+
+    @staticmethod
+    def request_key(area_id, dates):
+        return f"{area_id}|{','.join(dates)}"
+
+    @staticmethod
+    def digest(records):
+        """Content hash of one slice, independent of key order."""
+        return hashlib.sha1(json.dumps(records, sort_keys=True, separators=(",", ":")).encode()).hexdigest()
+
+    def request_headers(self, area_id, dates):
+        """Conditional request headers for a previously seen (area, dates) request."""
+        stored = self.validators.get(self.request_key(area_id, dates), {})
+        headers = {}
+        if stored.get("etag"):
+            headers["If-None-Match"] = stored["etag"]
+        if stored.get("last_modified"):
+            headers["If-Modified-Since"] = stored["last_modified"]
+        return headers
+
+    def store_validators(self, area_id, dates, headers):
+        """Remembers the validators of a fresh response, if the server sent any."""
+        etag = headers.get("ETag")
+        last_modified = headers.get("Last-Modified")
+        if etag or last_modified:
+            validators = self.pending.setdefault(area_id, ({}, {}))[1]
+            validators[self.request_key(area_id, dates)] = {"etag": etag, "last_modified": last_modified}
+
+    def not_modified(self, dates):
+        """Records a 304 response, where every requested slice is unchanged."""
+        self.hits += len(dates)
+
+    def diff(self, area_id, payload):
+        """
+        Returns only the slices of a response whose content changed since the last run.
+
+        Args:
+            area_id: Service area the payload belongs to.
+            payload: Response of the shape {date: [records]}.
+        """
+        changed = {}
+        hashes = self.pending.setdefault(area_id, ({}, {}))[0]
+        for date, records in payload.items():
+            key = self.slice_key(area_id, date)
+            digest = self.digest(records)
+            if self.hashes.get(key) == digest:
+                self.hits += 1
+                continue
+            hashes[key] = digest
+            self.misses += 1
+            changed[date] = records
+        return changed
+
+    def commit(self, area_id):
+        """Marks a station of the area as written."""
+        self.written.add(area_id)
+
+    def discard(self, area_id):
+        """Marks a station of the area as lost; the area's new hashes and validators are not kept."""
+        self.failed.add(area_id)
@@ -0,0 +1,206 @@
+import os
+import zlib
+import asyncio
+import logging
+import argparse
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from config import *
+from cookie_scrape import Cookies, CookieJar
+from site_scrape import SiteScraper
+from response_cache import ResponseCache
+from writer import DemandWriter, write_latest
+from history import HistoryStore
+from metrics import METRICS
+from ledger import RunLedger
+from normalize import plain_schema
+
+logger = logging.getLogger(__name__)
+
+SORT_KEYS = ["station", "area_id", "date", "startTime", "waveGroupId", "durationInMinutes"]
+SLICE_KEYS = ["station", "area_id", "date"]
+
+
+def shard_of(key, count):
+    """Stable shard index for a key; the same on every host and every run."""
+    return zlib.crc32(str(key).encode("utf-8")) % count
+
+
+def shard_sites(sites, index, count, key="area_id"):
+    """
+    Sites belonging to one shard.
+
+    Sites are hashed by service area, so every station of an area lands on the same
+    shard, and its delta cache and refresh state stay with one worker across runs.
+    """
+    return [site for site in sites if shard_of(site[key], count) == index]
+
+
+def shard_path(path, index):
+    """Per-shard variant of a path, e.g. demand.csv -> demand.shard-2.parquet."""
+    root, _ = os.path.splitext(path)
+    return f"{root}.shard-{index}.parquet"
+
+
+def shard_state_path(path, index):
+    """Per-shard variant of a state file, keeping its extension."""
+    root, ext = os.path.splitext(path)
+    return f"{root}.shard-{index}{ext}"
+
+
+async def scrape_shard(index, count, output=SAVE_PATH, site_filters=None, resume=False):
+    """
+    Scrapes one shard of the site list into its own Parquet file.
+
+    Each shard keeps its own cache, ledger and metrics files, so processes and hosts
+    never write the same file. Returns the shard output path.
+    """
+    cache = ResponseCache(shard_state_path(RESPONSE_CACHE_PATH, index)) if DELTA_SCRAPE else None
+    ledger = RunLedger(shard_state_path(LEDGER_PATH, index)) if CHECKPOINT_RUNS or resume else None
+    scraper = SiteScraper(SUI_URL, num_days=FORECAST_DAYS, cache=cache, ledger=ledger)
+    if ledger is not None:
+        scraper.dates_list = ledger.start(scraper.dates_list, resume=resume)
+    jar = CookieJar.shared(cookies_path())
+    jar.load()
+
+    sites = scraper.get_sites(**(site_filters if site_filters is not None else {"prefix": "D"}))
+    sites = shard_sites(sites, index, count)
+    logger.info(f"Shard {index}/{count}: {len(sites)} sites")
+
+    path = shard_path(output, index)
+    if os.path.exists(path):
+        os.remove(path)  # A shard with no rows must not leave a stale file for the merge
+
+    # A delta scrape only returns changed slices, so the shard file is rebuilt from the history
+    history = None
+    if KEEP_HISTORY or cache is not None:
+        history = HistoryStore(HISTORY_DIR, retention_days=HISTORY_RETENTION_DAYS)
+    stations = [site["station"] for site in sites]
+    with DemandWriter(None if cache is not None else path, capacity_type="CSP", history=history) as writer:
+        if resume:
+            sites = ledger.plan(sites, writer)
+        scraped = await scraper.scrape_all(sites, jar, max_concurrent=MAX_CONCURRENT, writer=writer)
+    if cache is not None and stations:
+        write_latest(history, path, stations=stations, lookback_days=scraper.num_days)
+    scraper.save_cache()
+    METRICS.write(shard_state_path(METRICS_PATH, index))
+    if ledger is not None:
+        ledger.finish()
+        ledger.close()
+
+    logger.info(f"Shard {index}/{count}: scraped {scraped}/{len(sites)} sites, {writer.rows} CSP rows")
+    return path
+
+
+def _run_shard(index, count, output, site_filters, resume=False):
+    return asyncio.run(scrape_shard(index, count, output, site_filters, resume))
+
+
+def run_local(workers, output=SAVE_PATH, site_filters=None, keep_shards=False, resume=False):
+    """
+    Scrapes all shards in parallel worker processes on this host, then merges them.
+
+    Cookies and the site map are validated and cached once in the parent, so the
+    workers only read them from disk. Resuming needs the same number of workers as
+    the interrupted run, since each shard resumes from its own ledger.
+    """
+    Cookies(SUI_URL).get_jar()
+    SiteScraper(SUI_URL).get_sites()
+
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=workers, mp_context=context) as pool:
+        futures = [pool.submit(_run_shard, i, workers, output, site_filters, resume) for i in range(workers)]
+        paths = []
+        for i, future in enumerate(futures):
+            try:
+                paths.append(future.result())
+            except Exception as e:
+                logger.error(f"Shard {i}/{workers} failed: {e}")
+
+    rows = merge(paths, output)
+    if not keep_shards:
+        for path in paths:
+            if os.path.exists(path):
+                os.remove(path)
+    return rows
+
+
+def merge(paths, output=SAVE_PATH):
+    """
+    Combines shard outputs into the final file.
+
+    A slice (station, area, date) found in more than one file, e.g. after a host was
+    re-run with a different shard count, is taken whole from the newest file. Rows
+    are never compared with each other, since two real blocks can differ only in
+    fields the normalization drops. Returns the number of rows written.
+    """
+    files = sorted((path for path in paths if os.path.exists(path)), key=os.path.getmtime)
+    tables = [(rank, pq.read_table(path)) for rank, path in enumerate(files)]
+    tables = [(rank, table) for rank, table in tables if table.num_rows]
+    if not tables:
+        logger.error("No shard data to merge")
+        return 0
+
+    schema = tables[0][1].schema
+    plain = plain_schema(schema)
+    table = pa.concat_tables([
+        table.cast(plain).append_column("shard_rank", pa.array([rank] * table.num_rows, pa.int32()))
+        for rank, table in tables
+    ])
+    newest = table.group_by(SLICE_KEYS, use_threads=False).aggregate([("shard_rank", "max")])
+    merged = table.join(newest, keys=SLICE_KEYS + ["shard_rank"], right_keys=SLICE_KEYS + ["shard_rank_max"],
+                        join_type="inner")
+    dropped = table.num_rows - merged.num_rows
+
+    sort_keys = [(name, "ascending") for name in SORT_KEYS if name in merged.column_names]
+    merged = merged.select(plain.names).sort_by(sort_keys).cast(schema)
+
+    root, ext = os.path.splitext(output)
+    tmp_path = f"{root}.tmp{ext}"
+    with DemandWriter(tmp_path, capacity_type="CSP") as writer:
+        writer.write_table(merged)
+    os.replace(tmp_path, output)
+
+    logger.info(f"Merged {len(tables)} shards into {output}: {merged.num_rows} rows, "
+                f"{dropped} rows of slices also in a newer shard dropped")
+    return merged.num_rows
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Sharded demand scraping across processes or hosts.")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1,
+                        help="Run this many shards as local processes and merge them")
+    parser.add_argument("--shard-index", type=int, help="Run a single shard, e.g. one per host")
+    parser.add_argument("--shard-count", type=int, help="Total number of shards across hosts")
+    parser.add_argument("--merge", action="store_true",
+                        help="Merge shard files 0..--shard-count-1 next to --output into it")
+    parser.add_argument("--output", default=SAVE_PATH)
+    parser.add_argument("--prefix", default="D", help="Station prefix filter")
+    parser.add_argument("--keep-shards", action="store_true", help="Keep shard files after a local merge")
+    parser.add_argument("--resume", action="store_true", help="Resume today's interrupted run")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    site_filters = {"prefix": args.prefix}
+
+    if args.merge:
+        # Only this run's shards: files left over from a run with more shards hold stale slices
+        if not args.shard_count:
+            raise SystemExit("--merge needs the --shard-count of the run")
+        merge([shard_path(args.output, i) for i in range(args.shard_count)], args.output)
+    elif args.shard_index is not None:
+        if not args.shard_count or not 0 <= args.shard_index < args.shard_count:
+            raise SystemExit("--shard-index needs --shard-count greater than it")
+        _run_shard(args.shard_index, args.shard_count, args.output, site_filters, args.resume)
+    else:
+        run_local(max(1, args.workers), args.output, site_filters, args.keep_shards, args.resume)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,135 @@
+import os
+import json
+import time
+import bisect
+import logging
+
+import pyarrow as pa
+import pyarrow.csv as pacsv
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+
+logger = logging.getLogger(__name__)
+
+
+class SiteMap:
+    """
+    Local, indexed mirror of the site mapping CSV.
+
+    The CSV on the network share is converted once into a Parquet file in cache_dir and
+    only re-read when its mtime or size changes. Within max_age seconds of the last check
+    the share is not touched at all, so startup does not wait on the VPN.
+    """
+
+    def __init__(self, source, cache_dir, max_age=900):
+        self.source = source
+        self.cache_dir = cache_dir
+        self.max_age = max_age
+        self.cache_path = os.path.join(cache_dir, "site_map.parquet")
+        self.meta_path = os.path.join(cache_dir, "site_map.json")
+        self.table = None
+        self.by_station = {}
+        self.by_area = {}
+        self.sorted_stations = []
+
+    def _read_meta(self):
+        try:
+            with open(self.meta_path, "r") as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return {}
+
+    def _write_meta(self, meta):
+        with open(self.meta_path, "w") as f:
+            json.dump(meta, f)
+
+    def _refresh_from_source(self, stat):
+        """Reads the source CSV, normalizes column names and rewrites the local cache."""
+        logger.info("Fetching & renaming sites...")
+        table = pacsv.read_csv(self.source)
+        table = table.rename_columns([c.lower().replace(" ", "_") for c in table.column_names])
+
+        os.makedirs(self.cache_dir, exist_ok=True)
+        tmp_path = f"{self.cache_path}.tmp"
+        pq.write_table(table, tmp_path)
+        os.replace(tmp_path, self.cache_path)
+        self._write_meta({"mtime": stat.st_mtime, "size": stat.st_size, "checked_at": time.time()})
+        return table
+
+    def load(self):
+        """Loads the site map, preferring the local cache whenever it is still current."""
+        meta = self._read_meta()
+        cached = os.path.exists(self.cache_path)
+
+        if cached and time.time() - meta.get("checked_at", 0) < self.max_age:
+            logger.info("Using cached site map")
+            table = pq.read_table(self.cache_path)
+        else:
+            try:
+                stat = os.stat(self.source)
+            except OSError as e:
+                if not cached:
+                    raise
+                logger.warning(f"Site map source unreachable, using cached copy. Is the VPN on? Error {e}")
+                stat = None
+
+            if stat is None:
+                table = pq.read_table(self.cache_path)
+            elif cached and meta.get("mtime") == stat.st_mtime and meta.get("size") == stat.st_size:
+                logger.info("Site map unchanged, using cached copy")
+                table = pq.read_table(self.cache_path)
+                self._write_meta({**meta, "checked_at": time.time()})
+            else:
+                table = self._refresh_from_source(stat)
+
+        self._build_indexes(table)
+        logger.info(f"Found {table.num_rows} site mappings.")
+        return self
+
+    def _build_indexes(self, table):
+        """Indexes row positions by station and area_id, plus a sorted station list for prefixes."""
+        self.table = table
+        self.by_station, self.by_area = {}, {}
+        stations = table["station"].to_pylist() if "station" in table.column_names else []
+        areas = table["area_id"].to_pylist() if "area_id" in table.column_names else []
+
+        for i, station in enumerate(stations):
+            self.by_station.setdefault(station, []).append(i)
+        for i, area_id in enumerate(areas):
+            self.by_area.setdefault(area_id, []).append(i)
+        self.sorted_stations = sorted(s for s in self.by_station if s is not None)
+
+    def _prefix_rows(self, prefix):
+        """Row positions of every station starting with prefix, found by binary search."""
+        lo = bisect.bisect_left(self.sorted_stations, prefix)
+        hi = bisect.bisect_left(self.sorted_stations, prefix + "\uffff")
+        return [i for station in self.sorted_stations[lo:hi] for i in self.by_station[station]]
+
+    def filter(self, prefix=None, region=None, stations=None, area_ids=None):
+        """
+        Returns the matching site mappings as a list of dicts.
+
+        Args:
+            prefix: Only stations starting with this prefix.
+            region: Only rows whose region column equals this value.
+            stations: Only these stations.
+            area_ids: Only these service areas.
+        """
+        if self.table is None:
+            self.load()
+
+        rows = None
+        if prefix:
+            rows = set(self._prefix_rows(prefix))
+        if stations is not None:
+            matched = {i for s in stations for i in self.by_station.get(s, [])}
+            rows = matched if rows is None else rows & matched
+        if area_ids is not None:
+            matched = {i for a in area_ids for i in self.by_area.get(a, [])}
+            rows = matched if rows is None else rows & matched
+
+        table = self.table if rows is None else self.table.take(pa.array(sorted(rows), type=pa.int64()))
+        if region is not None and "region" in table.column_names:
+            table = table.filter(pc.equal(table["region"], region))
+
+        return table.to_pylist()
@@ -1,125 +1,468 @@
 import asyncio
 import aiohttp
 import json
-import pandas as pd
+import time
 from datetime import datetime, timedelta
 import logging
 
 from config import *
-from cookie_scrape import Cookies
+from cookie_scrape import Cookies, CookieJar
+from writer import DemandWriter, write_latest
+from response_cache import ResponseCache
+from concurrency import AdaptiveLimiter, AuthError, AuthGate, RetryPolicy, TransientError, parse_retry_after
+from planner import RequestPlanner, stitch
+from site_map import SiteMap
+from decoding import PayloadDecoder, DecodeError
+from normalize import DEMAND_FIELDS
+from metrics import METRICS, SampledLogger
+from ledger import RunLedger
+from coalesce import RequestCoalescer
 
 logger = logging.getLogger(__name__)
+site_log = SampledLogger(logger, every=SITE_LOG_EVERY)
 
 class SiteScraper:
-    def __init__(self, url=SUI_URL, site_map=SITE_MAP, num_days=7):
+    def __init__(self, url=SUI_URL, site_map=SITE_MAP, num_days=FORECAST_DAYS, cache=None, retry=None, planner=None, decoder=None,
+                 scheduler=None, refresher=None, ledger=None):
         self.url = url
         self.site_map = site_map
+        self.sites = None
+        self.cache = cache
+        self.retry = retry or RetryPolicy(max_retries=MAX_RETRIES)
+        self.planner = planner or RequestPlanner(chunk_days=CHUNK_DAYS, adaptive=ADAPTIVE_CHUNKING)
+        self.decoder = decoder or PayloadDecoder(backend=JSON_DECODER, fields=DEMAND_FIELDS if EXTRACT_FIELDS else None)
+        self.scheduler = scheduler
+        self.refresher = refresher
+        self.ledger = ledger
+        self.demand_type = "Forecast"
+        # Shared across runs and callers, so identical requests in flight are sent once
+        self.coalescer = RequestCoalescer(endpoint="demand")
+        self.auth = AuthGate(max_refreshes=REAUTH_ATTEMPTS)
+        self.stats = {}
         self.counter = 0
-        self.dates_list = [(datetime.today() + timedelta(days=i)).strftime("%Y-%m-%d") for i in range(num_days)]
+        self.num_days = num_days
+        self.refresh_dates()
         self.data = []
 
-    def get_sites(self):
-        """Returns a list of managed sites and service areas"""
+    def refresh_dates(self):
+        """Rebuilds the date window from today, for scrapers that outlive a single day."""
+        self.dates_list = [(datetime.today() + timedelta(days=i)).strftime("%Y-%m-%d") for i in range(self.num_days)]
+
+    def get_sites(self, **filters):
+        """
+        Returns a list of managed sites and service areas.
+
+        Reads from the local site map cache; filters (prefix, region, stations, area_ids)
+        are applied to the cached table before any records are built.
+        """
         try:
-            logger.info("Fetching & renaming sites...")
-            sites = pd.read_csv(self.site_map)
-            for c in sites.columns:
-                sites.rename(columns={c: c.lower().replace(" ", "_")}, inplace=True)
-            logger.info(f"Found {sites.shape[0]} site mappings.")
-            return sites.to_dict(orient="records")
+            if self.sites is None:
+                self.sites = SiteMap(self.site_map, SITE_CACHE_DIR, max_age=SITE_CACHE_MAX_AGE).load()
+            return self.sites.filter(**filters)
 
         except Exception as e:
             logger.error(f"Failed to fetch the site mappings. Is the VPN on? Error {e}")
             return []
 
-    async def scrape_site_data(self, session, site, semaphore):
+    def request_params(self, site, dates):
+        """Query parameters of a demand request for one service area and a chunk of dates."""
+        return {
+            "dates": json.dumps(dates),
+            "serviceAreaId": site["area_id"],
+            "providerDemandType": self.demand_type,
+            "_": int(datetime.now().timestamp() * 1000)
+        }
+
+    @staticmethod
+    def auth_failed(response):
+        """True if a response means the session is not authenticated: 401/403, a login host or an HTML page."""
+        return response.status in (401, 403) or response.url.host in LOGIN_HOSTS or (
+            response.status == 200 and response.content_type == "text/html"
+        )
+
+    async def fetch_site_data(self, session, site, dates):
         """
-        Scrapes provider demand data for given service area.
+        Sends a single demand request for one service area and a chunk of dates.
+
+        With a response cache attached, only the date slices that changed since the
+        last run are returned; an empty dict means nothing changed. Raises TransientError
+        for throttling and server errors so the caller can retry, and AuthError when the
+        session has expired.
         """
-        async with semaphore:
+        params = self.request_params(site, dates)
+        headers = {}
+        if self.cache is not None:
+            headers = self.cache.request_headers(site["area_id"], dates)
+            if headers:
+                # Let the server validate against the stored ETag/Last-Modified
+                params.pop("_")
+
+        start = time.monotonic()
+        async with session.get(self.url, params=params, headers=headers) as response:
+
+            METRICS.inc("http_responses_total", endpoint="demand", status=response.status)
+
+            if response.status == 304 and self.cache is not None:
+                METRICS.observe("http_request_seconds", time.monotonic() - start, endpoint="demand")
+                site_log.debug("Response %s. Unchanged since last scrape", response.status)
+                self.cache.not_modified(dates)
+                if self.scheduler is not None:
+                    self.scheduler.record(site["area_id"], dates, changed=set())
+                return {}
+
+            if self.auth_failed(response):
+                METRICS.observe("http_request_seconds", time.monotonic() - start, endpoint="demand")
+                raise AuthError(f"Response {response.status} ({response.content_type}) from {response.url.host}")
+
+            if response.status == 200:
+                site_log.debug("Response %s. Successful scrape", response.status)
+                try:
+                    body = await response.read()
+                    latency = time.monotonic() - start
+                    METRICS.observe("http_request_seconds", latency, endpoint="demand")
+                    METRICS.inc("http_bytes_in_total", len(body), endpoint="demand")
+                    self.planner.observe(len(dates), latency, len(body))
+                    data = await self.decoder.decode_async(body)
+                    if self.cache is not None:
+                        self.cache.store_validators(site["area_id"], dates, response.headers)
+                        data = self.cache.diff(site["area_id"], data)
+                    if self.scheduler is not None:
+                        # Only the response cache can tell which slices actually changed
+                        self.scheduler.record(site["area_id"], dates, changed=set(data) if self.cache is not None else None)
+                    return data
+                except (DecodeError, UnicodeDecodeError) as e:
+                    if body.lstrip()[:1] == b"<":
+                        raise AuthError("HTML page instead of JSON") from e
+                    logger.error(f"Failed to parse JSON response: {e}")
+                    text = await response.text()
+                    logger.error(f"Response preview: {text[:50]}")
+                    return None
+
+            text = await response.text()
+            METRICS.observe("http_request_seconds", time.monotonic() - start, endpoint="demand")
+            if response.status == 429 or response.status >= 500:
+                raise TransientError(
+                    f"Response {response.status}",
+                    retry_after=parse_retry_after(response.headers.get("Retry-After"))
+                )
+
+            logger.error(f"Response {response.status}. Failed")
+            logger.error(f"Response preview: {text[:50]}")
+            return None
+
+    async def fetch_with_retry(self, session, site, dates, limiter):
+        """
+        Fetches one chunk, retrying transient failures with jittered exponential backoff.
+
+        Every attempt's latency and outcome is fed back into the concurrency limiter.
+        An expired session pauses all requests until it is re-authenticated, after which
+        the chunk is sent again. Returns (data, attempts), where data is None if the
+        chunk was lost.
+        """
+        for attempt in range(self.retry.max_retries + 1):
+            wait_start = time.monotonic()
+            generation = await self.auth.wait()
+            await limiter.acquire()
+            start = time.monotonic()
+            METRICS.observe("queue_wait_seconds", start - wait_start, endpoint="demand")
             try:
-                self.counter += 1
-                logger.info(f"Scraping site {self.counter}: {site['station']}")
-
-                async with session.get(
-                    self.url,
-                    params={
-                        "dates": json.dumps(self.dates_list),
-                        "serviceAreaId": site["area_id"],
-                        "providerDemandType": "Forecast",
-                        "_": int(datetime.now().timestamp() * 1000)
-                    }
-                ) as response:
-
-                    if response.status == 200:
-                        logger.info(f"Response {response.status}. Successful scrape")
-                        try:
-                            data = await response.json()
-                            return data
-                        except json.JSONDecodeError as e:
-                            logger.error(f"Failed to parse JSON response: {e}")
-                            text = await response.text()
-                            logger.error(f"Response preview: {text[:50]}")
-                            return None
-                    else:
-                        logger.error(f"Response {response.status}. Failed")
-                        text = await response.text()
-                        logger.error(f"Response preview: {text[:50]}")
-                        return None
+                data = await self.fetch_site_data(session, site, dates)
+            except (TransientError, aiohttp.ClientError, asyncio.TimeoutError) as e:
+                await limiter.release(time.monotonic() - start, ok=False)
+                if attempt == self.retry.max_retries:
+                    logger.error(f"Giving up on {site['station']} after {attempt + 1} attempts: {e}")
+                    return None, attempt + 1
 
+                delay = self.retry.delay(attempt, getattr(e, "retry_after", None))
+                logger.warning(f"Transient failure for {site['station']} ({e!r}), retrying in {delay:.1f}s")
+                self.stats["retries"] += 1
+                METRICS.inc("retries_total", endpoint="demand")
+                await asyncio.sleep(delay)
+                continue
+            except AuthError as e:
+                # Not a load signal, so the limit is left alone
+                await limiter.release(time.monotonic() - start)
+                if attempt < self.retry.max_retries and await self.auth.refresh(
+                    generation, lambda: self.reauthenticate(session, site, dates)
+                ):
+                    self.stats["requeued"] += 1
+                    continue
+                logger.error(f"Not authenticated for {site['station']}: {e}")
+                return None, attempt + 1
             except Exception as e:
-                logger.error(f"Failed to scrape site data {site["station"]}: {e}")
-                return None
-
-    async def scrape_all(self, sites, cookie, max_concurrent=15):
-        """Scrapes all sites concurrently with rate limiting."""
-        semaphore = asyncio.Semaphore(max_concurrent)
-
-        async with aiohttp.ClientSession(
-            headers={
-                "Cache-Control": "no-cache",
-                "Pragma": "no-cache",
-                "Cookie": cookie,
-                "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/142.0.0.0 Safari/537.36"
-            }
-        ) as session:
-            tasks = [self.scrape_site_data(session, site, semaphore) for site in sites]
+                await limiter.release(time.monotonic() - start)
+                logger.error(f"Failed to scrape site data {site['station']}: {e}")
+                return None, attempt + 1
+
+            await limiter.release(time.monotonic() - start)
+            return data, attempt + 1
+
+    async def fetch_chunk(self, session, site, dates, limiter):
+        """
+        fetch_with_retry, coalesced with identical requests already in flight.
+
+        With a ledger attached the chunk is checkpointed once per request, inside the
+        shared task, however many stations of the area await it.
+        """
+        key = (site["area_id"], tuple(dates), self.demand_type)
+        if key in self.coalescer:
+            self.stats["coalesced"] += 1
+
+        async def fetch():
+            data, attempts = await self.fetch_with_retry(session, site, dates, limiter)
+            if self.ledger is not None:
+                await self.ledger.record_async(site["area_id"], dates, data, attempts)
+            return data, attempts
+
+        return await self.coalescer.run(key, fetch)
+
+    async def scrape_site_data(self, session, site, limiter):
+        """Scrapes provider demand data for given service area, counting the site's outcome."""
+        data, outcome = await self.fetch_site(session, site, limiter)
+        self.count_outcome(outcome)
+        return data
+
+    def settle_cache(self, site, handed_over):
+        """Tells the response cache whether a site's data was handed over or lost."""
+        if self.cache is not None:
+            (self.cache.commit if handed_over else self.cache.discard)(site["area_id"])
+
+    def count_outcome(self, outcome):
+        self.stats[outcome] += 1
+        METRICS.inc("sites_total", outcome=outcome)
+
+    async def fetch_site(self, session, site, limiter):
+        """
+        Fetches provider demand data for given service area. Returns (payload, outcome).
+
+        The date window (the site's own "dates" if a refresh schedule set them) is split
+        into chunks by the request planner, fetched concurrently and stitched back into a
+        single {date: [records]} payload.
+
+        Stations that share a service area share each chunk's request: a chunk already
+        in flight for the same area, dates and demand type is awaited, not re-sent.
+        """
+        self.counter += 1
+        site_log.debug("Scraping site %d: %s", self.counter, site["station"])
+
+        chunks = self.planner.plan(site.get("dates", self.dates_list))
+        results = await asyncio.gather(*[self.fetch_chunk(session, site, dates, limiter) for dates in chunks])
+
+        fetched = [data for data, _ in results if data is not None]
+        if not fetched:
+            outcome = "lost"
+        elif len(fetched) < len(chunks):
+            logger.warning(f"Only {len(fetched)}/{len(chunks)} date chunks scraped for {site['station']}")
+            outcome = "partial"
+        elif any(attempts > 1 for _, attempts in results):
+            outcome = "recovered"
+        else:
+            outcome = "ok"
+
+        if not fetched:
+            return None, outcome
+        return stitch(fetched), outcome
+
+    async def scrape_and_write(self, session, site, limiter, writer):
+        """
+        Scrapes a single site and hands the response straight to the writer.
+
+        A response the writer rejects, e.g. a quantity that is not a number, loses
+        that site only instead of aborting the run.
+        """
+        data, outcome = await self.fetch_site(session, site, limiter)
+        if data is not None:
+            try:
+                writer.write(site, data)
+            except Exception as e:
+                logger.error(f"Failed to write site data {site['station']}: {e!r}")
+                outcome, data = "lost", None
+        self.settle_cache(site, data is not None)
+        self.count_outcome(outcome)
+        return data is not None
+
+    async def scrape_and_put(self, session, site, limiter, queue):
+        """Scrapes a single site and queues (site, payload) for the next pipeline stage."""
+        data = await self.scrape_site_data(session, site, limiter)
+        self.settle_cache(site, data is not None)
+        if data is None:
+            return False
+        await queue.put((site, data))
+        return True
+
+    async def scrape_all(self, sites, cookie, max_concurrent=15, writer=None):
+        """
+        Scrapes all sites concurrently with adaptive rate limiting.
+
+        cookie is either a Cookie header string or a CookieJar; a jar is plugged into the
+        session and any rotated cookies are saved back when the run ends.
+
+        max_concurrent is the starting number of in-flight requests; the limiter grows
+        or shrinks it from observed latency and errors.
+
+        If a writer is given, each response is written as soon as it arrives instead of
+        being collected, and only the number of successfully scraped sites is returned.
+        """
+        limiter = AdaptiveLimiter(initial=max_concurrent, max_limit=MAX_CONCURRENT_LIMIT)
+        session = self.open_session(cookie)
+
+        async with session:
+            try:
+                return await self.dispatch(session, sites, limiter, writer)
+            finally:
+                if isinstance(cookie, CookieJar):
+                    cookie.sync_from_aiohttp(session.cookie_jar)
+                    cookie.save()
+
+    async def probe_auth(self, session, site, dates):
+        """
+        Sends one request for the first date and applies the auth checks of fetch_site_data.
+
+        Returns False only if the session is still not authenticated; other failures
+        say nothing about the cookies.
+        """
+        try:
+            async with session.get(self.url, params=self.request_params(site, dates[:1])) as response:
+                if self.auth_failed(response):
+                    return False
+                body = await response.read()
+                return response.status != 200 or body.lstrip()[:1] != b"<"
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            logger.warning(f"Could not probe the refreshed session: {e!r}")
+            return True
+
+    async def reauthenticate(self, session, site=None, dates=None):
+        """
+        Refreshes the cookies mid-run and swaps them into the open session.
+
+        The refresher is an async callable returning a CookieJar, or None on failure;
+        by default the browser login from Cookies. Given the site and dates of the
+        request that failed, the refresh only counts once a probe request for them
+        is authenticated.
+        """
+        logger.warning("Session expired mid-run, pausing requests to re-authenticate...")
+        refresher = self.refresher or Cookies(SUI_URL).refresh_async
+        jar = await refresher()
+        if jar is None:
+            METRICS.inc("reauth_total", outcome="failed")
+            logger.error("Re-authentication failed, remaining requests will be dropped")
+            return False
+
+        if "Cookie" in session.headers:
+            session.headers["Cookie"] = jar.as_string()
+        else:
+            jar.fill_aiohttp(session.cookie_jar)
+
+        if site is not None and not await self.probe_auth(session, site, dates or self.dates_list):
+            METRICS.inc("reauth_total", outcome="rejected")
+            logger.error("Refreshed cookies are still not accepted, remaining requests will be dropped")
+            return False
+        METRICS.inc("reauth_total", outcome="ok")
+        logger.info("Re-authenticated, resuming requests")
+        return True
+
+    @staticmethod
+    def open_session(cookie):
+        """Opens a client session carrying a Cookie header string or a CookieJar."""
+        headers = {
+            "Cache-Control": "no-cache",
+            "Pragma": "no-cache",
+            "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/142.0.0.0 Safari/537.36"
+        }
+        if isinstance(cookie, CookieJar):
+            # A real cookie jar keeps any Set-Cookie rotations for the rest of the run
+            return aiohttp.ClientSession(headers=headers, cookie_jar=cookie.aiohttp_jar())
+        return aiohttp.ClientSession(headers={**headers, "Cookie": cookie})
+
+    async def dispatch(self, session, sites, limiter, writer=None, queue=None):
+        """
+        Runs every site through the limiter on an open session.
+
+        Results go to the writer, or to an asyncio queue as (site, payload) pairs; either
+        way only the number of scraped sites is returned.
+        """
+        self.counter = 0
+        self.stats = {"ok": 0, "recovered": 0, "partial": 0, "lost": 0, "retries": 0, "requeued": 0, "coalesced": 0}
+        self.auth = AuthGate(max_refreshes=REAUTH_ATTEMPTS)
+        if writer is not None or queue is not None:
+            if queue is not None:
+                tasks = [self.scrape_and_put(session, site, limiter, queue) for site in sites]
+            else:
+                tasks = [self.scrape_and_write(session, site, limiter, writer) for site in sites]
             results = await asyncio.gather(*tasks)
-            return [r for r in results if r is not None]
-            
+            self.log_stats(limiter)
+            return sum(results)
+
+        tasks = [self.scrape_site_data(session, site, limiter) for site in sites]
+        results = await asyncio.gather(*tasks)
+        for site, data in zip(sites, results):
+            self.settle_cache(site, data is not None)
+        self.log_stats(limiter)
+        return [r for r in results if r is not None]
 
+    def log_stats(self, limiter):
+        """Reports how many sites succeeded first time, were recovered by retries or were lost."""
+        logger.info(
+            f"Scrape finished: {self.stats['ok']} ok, {self.stats['recovered']} recovered by retries, "
+            f"{self.stats['partial']} partial, {self.stats['lost']} lost, {self.stats['retries']} retries, "
+            f"{self.stats['requeued']} re-sent after re-authentication, "
+            f"{self.stats['coalesced']} shared with another station. "
+            f"Concurrency ended at {int(limiter.limit)} (peak {limiter.peak})"
+        )
 
-async def main():
-    scraper = SiteScraper(SUI_URL, num_days=7)
+    def save_cache(self):
+        """Persists the response cache and refresh schedule after a run, if attached."""
+        if self.cache is not None:
+            logger.info(f"Response cache: {self.cache.hits} unchanged slices, {self.cache.misses} changed")
+            self.cache.save()
+        if self.scheduler is not None:
+            self.scheduler.save()
+
+
+async def main(output=SAVE_PATH, site_filters=None, resume=False):
+    cache = ResponseCache(RESPONSE_CACHE_PATH) if DELTA_SCRAPE else None
+    ledger = RunLedger(LEDGER_PATH) if CHECKPOINT_RUNS or resume else None
+    scraper = SiteScraper(SUI_URL, num_days=FORECAST_DAYS, cache=cache, ledger=ledger)
+    if ledger is not None:
+        scraper.dates_list = ledger.start(scraper.dates_list, resume=resume)
     cc = Cookies(SUI_URL)
 
-    cookies = cc.main()
-    sites = scraper.get_sites()
-
-    # Filter sites starting with "D"
-    sites = [site for site in sites if site.get("station", "").startswith("D")]
-    logger.info(f"Filtered to {len(sites)} sites starting with 'D'")
-
-    # Scrape all sites asynchronously
-    all_data = await scraper.scrape_all(sites, cookies, max_concurrent=15)
-
-    if all_data:
-        # Flatten: [{date: [records]}, ...] -> [{date, ...record}, ...]
-        records = [
-            {"date": date, **record}
-            for site_data in all_data
-            if site_data
-            for date, recs in site_data.items()
-            for record in recs
-        ]
-        df = pd.DataFrame(records)
-        df = df[df["capacityType"] == "CSP"]
-        df['startTime'] = pd.to_datetime(df['startTime'], unit='ms')
-
-        logger.info(f"DataFrame shape: {df.shape}")
-        print(df[['date', 'startTime', 'requiredQuantity', 'scheduledQuantity', 'waveGroupId']].head(20))
-        df.to_csv(SAVE_PATH, index=False)
-        logger.info(f"Data saved to {SAVE_PATH}")
+    cookies = cc.get_jar()
+    # Sites starting with "D" unless filtered otherwise
+    site_filters = site_filters if site_filters is not None else {"prefix": "D"}
+    sites = scraper.get_sites(**site_filters)
+    logger.info(f"Filtered to {len(sites)} sites matching {site_filters}")
+
+    # Scrape all sites asynchronously, streaming each response to disk as it arrives.
+    # A delta scrape only returns changed slices, so its output is rebuilt from the history
+    history = None
+    if KEEP_HISTORY or cache is not None:
+        # pyarrow.dataset pulls in pandas, so it is only imported when history is kept
+        from history import HistoryStore
+        history = HistoryStore(HISTORY_DIR, retention_days=HISTORY_RETENTION_DAYS)
+    with DemandWriter(None if cache is not None else output, capacity_type="CSP", history=history) as writer:
+        if resume:
+            # Write what the interrupted run already fetched, then scrape only the rest
+            sites = ledger.plan(sites, writer)
+        scraped = await scraper.scrape_all(sites, cookies, max_concurrent=MAX_CONCURRENT, writer=writer)
+    scraper.save_cache()
+    METRICS.write(METRICS_PATH)
+    if ledger is not None:
+        ledger.finish()
+        ledger.close()
+
+    if cache is not None:
+        logger.info(f"Scraped {scraped}/{len(sites)} sites, {writer.rows} changed CSP rows")
+        root, ext = os.path.splitext(output)
+        tmp_path = f"{root}.tmp{ext}"
+        if write_latest(history, tmp_path, lookback_days=scraper.num_days):
+            os.replace(tmp_path, output)
+            logger.info(f"Data saved to {output}")
+        else:
+            logger.error("No data retrieved")
+    elif writer.rows:
+        logger.info(f"Scraped {scraped}/{len(sites)} sites, {writer.rows} CSP rows")
+        logger.info(f"Data saved to {output}")
     else:
         logger.error("No data retrieved")
 
@@ -0,0 +1,162 @@
+import os
+import json
+import sqlite3
+import logging
+from datetime import datetime, timedelta
+
+from config import *
+
+logger = logging.getLogger(__name__)
+
+PENDING_STATUSES = ["PROCESSING", "UPLOADING"]
+SUCCESS_STATUSES = ["SUCCESS", "SUCCEEDED", "COMPLETED"]
+# Statuses reported as failures; statuses in none of these lists are neither, extend as they are seen
+FAILED_STATUSES = ["FAILED", "FAILURE", "ERROR", "REJECTED"]
+
+# Records can show up in the status page slightly after their upload time
+WATERMARK_OVERLAP = timedelta(minutes=5)
+
+
+def status_key(upload_type, filename):
+    """Key used to match status records to uploads, ignoring the file extension."""
+    return upload_type, os.path.splitext(filename or "")[0]
+
+
+def _ms(when):
+    return int(when.timestamp() * 1000)
+
+
+class StatusIndex:
+    """
+    Local copy of the upload status records in SQLite.
+
+    Records are keyed by (fileType, fileName) and upload time, so the latest status of
+    a file or the failures in a time range are index lookups. The status page is only
+    queried from the watermark onwards: the newest upload seen, or the oldest upload
+    still processing, since its record will change. Refreshes filtered to one upload
+    type keep their own watermark.
+    """
+
+    def __init__(self, path=STATUS_INDEX_PATH):
+        self.path = path
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.conn = sqlite3.connect(path)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript("""
+            CREATE TABLE IF NOT EXISTS records (
+                file_type TEXT NOT NULL,
+                file_key TEXT NOT NULL,
+                uploaded_at INTEGER NOT NULL,
+                status TEXT,
+                record TEXT NOT NULL,
+                PRIMARY KEY (file_type, file_key, uploaded_at)
+            );
+            CREATE INDEX IF NOT EXISTS records_uploaded ON records (uploaded_at);
+            CREATE TABLE IF NOT EXISTS meta (
+                name TEXT PRIMARY KEY,
+                value REAL NOT NULL
+            );
+        """)
+        self.conn.commit()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self.conn.close()
+
+    def _meta(self, name):
+        row = self.conn.execute("SELECT value FROM meta WHERE name = ?", (name,)).fetchone()
+        return None if row is None else row[0]
+
+    def watermark(self, upload_type=None):
+        """Upload time (ms) the next refresh starts from, or None before the first refresh."""
+        value = self._meta(f"watermark:{upload_type or '*'}")
+        return None if value is None else int(value)
+
+    def window(self, upload_type=None):
+        """(utcStartDateTime, utcEndDateTime) in ms for the next incremental refresh."""
+        now = datetime.now()
+        watermark = self.watermark(upload_type)
+        if watermark is None:
+            start = _ms(now - timedelta(hours=STATUS_INDEX_BACKFILL_HOURS))
+        else:
+            start = watermark - int(WATERMARK_OVERLAP.total_seconds() * 1000)
+        return start, _ms(now + WATERMARK_OVERLAP)
+
+    def update(self, records, window_start=None, upload_type=None, complete=True):
+        """
+        Stores status records, replacing earlier versions of the same upload.
+
+        The watermark (of upload_type's refreshes, or of unfiltered ones) only moves if
+        the records cover everything since it: they were queried from window_start (ms)
+        no later than the next refresh would be, and every page was read (complete).
+        """
+        rows = []
+        for record in records:
+            file_type, file_key = status_key(record.get("fileType"), record.get("fileName"))
+            uploaded = record.get("uploadedDateTime")
+            if file_type is None or uploaded is None:
+                continue
+            rows.append((file_type, file_key, int(uploaded), record.get("status"), json.dumps(record)))
+
+        self.conn.executemany(
+            "INSERT OR REPLACE INTO records (file_type, file_key, uploaded_at, status, record) VALUES (?, ?, ?, ?, ?)",
+            rows
+        )
+
+        if not complete or (window_start is not None and window_start > self.window(upload_type)[0]):
+            self.conn.commit()
+            return len(rows)
+
+        # Hold the watermark at the oldest unfinished upload, unless it is too old to still finish
+        hold_from = _ms(datetime.now() - timedelta(hours=STATUS_INDEX_BACKFILL_HOURS))
+        type_filter, type_args = ("AND file_type = ?", (upload_type,)) if upload_type else ("", ())
+        pending = self.conn.execute(
+            f"SELECT MIN(uploaded_at) FROM records WHERE uploaded_at >= ? {type_filter} "
+            f"AND status IN ({', '.join('?' * len(PENDING_STATUSES))})",
+            (hold_from, *type_args, *PENDING_STATUSES)
+        ).fetchone()[0]
+        newest = self.conn.execute(
+            "SELECT MAX(uploaded_at) FROM records" + (" WHERE file_type = ?" if upload_type else ""), type_args
+        ).fetchone()[0]
+        watermark = pending if pending is not None else newest
+        if watermark is not None:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO meta (name, value) VALUES (?, ?)", (f"watermark:{upload_type or '*'}", watermark)
+            )
+        self.conn.commit()
+        return len(rows)
+
+    def latest(self, upload_type, filename, since=None):
+        """Newest status record of a file, optionally only if uploaded after since (a datetime)."""
+        row = self.conn.execute(
+            "SELECT record FROM records WHERE file_type = ? AND file_key = ? AND uploaded_at >= ? "
+            "ORDER BY uploaded_at DESC LIMIT 1",
+            (*status_key(upload_type, filename), _ms(since) if since else 0)
+        ).fetchone()
+        return None if row is None else json.loads(row["record"])
+
+    def history(self, upload_type, filename):
+        """Every status record of a file, newest first."""
+        rows = self.conn.execute(
+            "SELECT record FROM records WHERE file_type = ? AND file_key = ? ORDER BY uploaded_at DESC",
+            status_key(upload_type, filename)
+        )
+        return [json.loads(row["record"]) for row in rows]
+
+    def failures(self, since=None, upload_type=None, statuses=FAILED_STATUSES):
+        """Uploads with a failure status since a datetime (default the last hour), newest first."""
+        since = since or datetime.now() - timedelta(hours=1)
+        type_filter, type_args = ("AND file_type = ?", (upload_type,)) if upload_type else ("", ())
+        rows = self.conn.execute(
+            f"SELECT record FROM records WHERE uploaded_at >= ? {type_filter} "
+            f"AND status IN ({', '.join('?' * len(statuses))}) ORDER BY uploaded_at DESC",
+            (_ms(since), *type_args, *statuses)
+        )
+        return [json.loads(row["record"]) for row in rows]
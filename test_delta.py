@@ -0,0 +1,41 @@
+from datetime import date, datetime, timedelta
+
+from history import HistoryStore
+from response_cache import ResponseCache
+from writer import DemandWriter
+
+SITE = {"station": "D001", "area_id": "a1"}
+
+
+def blocks(capacity_type="CSP"):
+    return [{"capacityType": capacity_type, "startTime": 1735725600000, "durationInMinutes": 60,
+             "requiredQuantity": 1, "scheduledQuantity": 1, "waveGroupId": "W"}]
+
+
+def test_withdrawn_slice_leaves_the_snapshot(tmp_path):
+    today, tomorrow = date.today().isoformat(), (date.today() + timedelta(days=1)).isoformat()
+    first = datetime.now() - timedelta(minutes=15)
+    with DemandWriter(None, history=HistoryStore(str(tmp_path), run_ts=first)) as writer:
+        writer.write(SITE, {today: blocks(), tomorrow: blocks()})
+
+    # Every CSP block of today was withdrawn; only the changed slice is written
+    with DemandWriter(None, history=HistoryStore(str(tmp_path))) as writer:
+        writer.write(SITE, {today: blocks("DSP")})
+
+    latest = HistoryStore(str(tmp_path)).latest(columns=["station", "date"])
+    assert latest["date"].to_pylist() == [tomorrow]
+
+
+def test_rejected_slices_count_as_changed_next_run(tmp_path):
+    cache = ResponseCache(str(tmp_path / "cache.json"))
+    payload = {"2025-01-01": blocks()}
+    assert cache.diff("a1", payload) == payload
+    cache.commit("a1")
+    cache.discard("a1")  # Another station of the area could not be written
+    cache.save()
+
+    cache = ResponseCache(str(tmp_path / "cache.json"))
+    assert cache.diff("a1", payload) == payload
+    cache.commit("a1")
+    cache.save()
+    assert ResponseCache(str(tmp_path / "cache.json")).diff("a1", payload) == {}
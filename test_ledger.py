@@ -0,0 +1,36 @@
+from datetime import date, timedelta
+
+from history import HistoryStore
+from ledger import RunLedger
+from writer import DemandWriter
+
+
+def payload(dates, quantity=1):
+    return {d: [{"capacityType": "CSP", "startTime": 1735725600000, "durationInMinutes": 60,
+                 "requiredQuantity": quantity, "scheduledQuantity": 1, "waveGroupId": "W"}] for d in dates}
+
+
+def test_resume_replays_checkpoints_into_history(tmp_path):
+    dates = [(date.today() + timedelta(days=i)).isoformat() for i in range(2)]
+    sites = [{"station": f"D00{i}", "area_id": f"a{i}"} for i in range(3)]
+
+    # A run that checkpointed two areas, then was killed before its history was flushed
+    ledger = RunLedger(str(tmp_path / "ledger.sqlite"))
+    ledger.start(dates)
+    ledger.record("a0", dates, payload(dates))
+    ledger.record("a1", dates, payload(dates))
+    ledger.close()
+
+    ledger = RunLedger(str(tmp_path / "ledger.sqlite"))
+    assert ledger.start(dates, resume=True) == dates
+    history = HistoryStore(str(tmp_path / "history"))
+    with DemandWriter(None, history=history) as writer:
+        pending = ledger.plan(sites, writer)
+        writer.write(pending[0], payload(dates, quantity=2))
+    ledger.close()
+
+    assert [site["station"] for site in pending] == ["D002"]
+    latest = history.latest(columns=["station", "date", "requiredQuantity"])
+    latest = latest.sort_by([("station", "ascending"), ("date", "ascending")])
+    assert latest["station"].to_pylist() == ["D000", "D000", "D001", "D001", "D002", "D002"]
+    assert latest["requiredQuantity"].to_pylist() == [1, 1, 1, 1, 2, 2]
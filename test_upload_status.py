@@ -0,0 +1,89 @@
+import time
+import asyncio
+
+from aiohttp import web
+
+from status_index import StatusIndex, WATERMARK_OVERLAP
+from upload_status import StatusPoller
+
+
+async def serve(handler):
+    """Runs handler as a local status page. Returns (runner, url)."""
+    app = web.Application()
+    app.router.add_get("/status", handler)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    return runner, f"http://127.0.0.1:{port}/status"
+
+
+async def login_page(request):
+    return web.Response(text="<html><body>Sign in</body></html>", content_type="text/html")
+
+
+def poll(tmp_path, handler, **poller_args):
+    async def run():
+        runner, url = await serve(handler)
+        try:
+            async with StatusPoller("session=x", url=url, min_interval=0.05, max_interval=0.1,
+                                    index=StatusIndex(str(tmp_path / "status.sqlite")), **poller_args) as poller:
+                return await asyncio.wait_for(poller.track("Demand", "file_1.csv"), timeout=5)
+        finally:
+            await runner.cleanup()
+
+    return asyncio.run(run())
+
+
+def test_login_page_still_times_out(tmp_path):
+    # A 200 HTML login page must not stop the poller before the upload times out
+    assert poll(tmp_path, login_page, timeout=0.5) == {}
+
+
+def test_unexpected_error_fails_pending_uploads(tmp_path, monkeypatch):
+    def broken(self, records):
+        raise RuntimeError("broken status record")
+
+    async def empty(request):
+        return web.json_response({"statusRecordList": []})
+
+    monkeypatch.setattr(StatusPoller, "_resolve", broken)
+    try:
+        poll(tmp_path, empty, timeout=30)
+    except RuntimeError as e:
+        assert "broken status record" in str(e)
+    else:
+        raise AssertionError("pending upload was not failed")
+
+
+def test_every_status_page_is_read(tmp_path):
+    now = int(time.time() * 1000)
+    pages = {
+        "": {"statusRecordList": [{"fileType": "Demand", "fileName": "file_0.csv", "uploadedDateTime": now,
+                                   "status": "SUCCESS"}], "token": "page-2"},
+        "page-2": {"statusRecordList": [{"fileType": "Demand", "fileName": "file_1.csv", "uploadedDateTime": now,
+                                         "status": "FAILED"}]},
+    }
+
+    async def paged(request):
+        assert request.query["fileType"] == "Demand"
+        return web.json_response(pages[request.query["token"]])
+
+    # The tracked upload is only on the second page
+    assert poll(tmp_path, paged, timeout=5)["status"] == "FAILED"
+    index = StatusIndex(str(tmp_path / "status.sqlite"))
+    assert [record["fileName"] for record in index.failures(upload_type="Demand")] == ["file_1.csv"]
+
+
+def test_unfiltered_refresh_keeps_its_own_watermark(tmp_path):
+    index = StatusIndex(str(tmp_path / "status.sqlite"))
+    uploaded = int(time.time() * 1000) - 60 * 1000
+    record = {"fileType": "Demand", "fileName": "file_1.csv", "uploadedDateTime": uploaded, "status": "SUCCESS"}
+
+    index.update([record], window_start=index.window()[0])
+    assert index.watermark() == uploaded
+    assert index.watermark("Demand") is None
+
+    # The next unfiltered refresh starts from its watermark instead of the full backfill
+    assert index.window()[0] == uploaded - WATERMARK_OVERLAP.total_seconds() * 1000
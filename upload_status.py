@@ -1,80 +1,320 @@
-import requests
+import aiohttp
+import asyncio
 from datetime import datetime, timedelta
 import time
 import logging
 
 from config import *
-from cookie_scrape import Cookies
+from cookie_scrape import Cookies, CookieJar
+from metrics import METRICS
+from status_index import StatusIndex, status_key, PENDING_STATUSES
 
 logger = logging.getLogger(__name__)
 
-def get_upload_status(url, upload_type, filename, cookies):
+# Pages followed per query before giving up; the watermark only moves once every page was read
+MAX_STATUS_PAGES = 50
+
+
+def status_params(window_start, window_end, upload_type=None, token=None):
+    """statusRecordPage query for a window in ms, optionally one upload type, from a page token."""
+    return {
+        "utcEndDateTime": window_end,
+        "utcStartDateTime": window_start,
+        "fileType": upload_type or "",
+        "fileName": "",
+        "uploadedBy": "",
+        "token": token or "",
+        "_": int(datetime.now().timestamp() * 1000)
+    }
+
+
+def refresh_status_index(index, url, cookies, upload_type=None):
+    """
+    Pulls the status records uploaded since the index watermark into the index.
+
+    Every page of the query is read, following the page token. With upload_type only
+    that type is queried, against its own watermark. cookies is a header string or a
+    CookieJar. Returns the number of records received, or None if the query failed.
+    """
+    import requests
+
+    headers = {
+        "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/142.0.0.0 Safari/537.36"
+    }
+    request_cookies = None
+    if isinstance(cookies, CookieJar):
+        request_cookies = cookies.requests_jar()
+    else:
+        headers["Cookie"] = cookies
+
+    window_start, window_end = index.window(upload_type)
+    records, token = [], None
     try:
-        response = requests.get(
-            url=url,
-            headers={
-                "Cookie": cookies,
-                "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/142.0.0.0 Safari/537.36"
-            },
-            params={
-                "utcEndDateTime": "",
-                "utcStartDateTime": "",
-                "fileType": upload_type,
-                "fileName": filename,
-                "uploadedBy": "",
-                "token": "",
-                "_": int(datetime.now().timestamp() * 1000)
-            }
-        )
-
-        if response.status_code == 200:
-            logger.info(f"Verifying upload status of file")
-            try:
-                status = response.json()["statusRecordList"]
+        for _ in range(MAX_STATUS_PAGES):
+            start = time.monotonic()
+            response = requests.get(
+                url=url,
+                headers=headers,
+                cookies=request_cookies,
+                params=status_params(window_start, window_end, upload_type, token)
+            )
 
-                # Filter for recent uploads (last 30 minutes)
-                cutoff_time = datetime.now() - timedelta(minutes=300)
-                status_filtered = []
+            METRICS.observe("http_request_seconds", time.monotonic() - start, endpoint="status")
+            METRICS.inc("http_responses_total", endpoint="status", status=response.status_code)
+            METRICS.inc("http_bytes_in_total", len(response.content), endpoint="status")
 
-                for s in status:
-                    upload_time = datetime.fromtimestamp(s["uploadedDateTime"] / 1000)
-                    if upload_time >= cutoff_time:
-                        status_filtered.append(s)
+            if isinstance(cookies, CookieJar):
+                # Keep any cookies the server rotated on this response
+                cookies.sync_from_requests(response.cookies)
+                cookies.save()
 
-                return status_filtered[0] if status_filtered else status
+            if response.status_code != 200:
+                logger.info(f"Failed to refresh upload status, response {response.status_code}")
+                return None
+            try:
+                data = response.json()
+                records.extend(data["statusRecordList"])
             except Exception as e:
                 logger.error(f"Issues finding status...{e}")
-                
-
-
+                return None
+            token = data.get("token")
+            if not token:
+                break
         else:
-            logger.info(f"Failed to verify upload status. No recent records found.")
+            logger.warning(f"Status query still had pages after {MAX_STATUS_PAGES}, keeping the watermark")
+
+        index.update(records, window_start=window_start, upload_type=upload_type, complete=not token)
+        return len(records)
 
     except Exception as e:
         print(f"Failed due to: {e}")
 
 
-def get_processed_status(url, upload_type, filename, cookies):
-    """Queries for status until it's uploaded or processed"""
-    max_attempts = 5
-    attempts = 0
+def get_upload_status(url, upload_type, filename, cookies, index=None):
+    """
+    Fetches the status record of an uploaded file. cookies is a header string or a CookieJar.
+
+    Only records of the upload type newer than the local status index are downloaded.
+    Returns the file's latest record from the last 300 minutes, otherwise every record
+    known for it.
+    """
+    own_index = index is None
+    index = index or StatusIndex(STATUS_INDEX_PATH)
+    try:
+        if refresh_status_index(index, url, cookies, upload_type) is None:
+            return None
+        logger.info(f"Verifying upload status of file")
+        record = index.latest(upload_type, filename, since=datetime.now() - timedelta(minutes=300))
+        return record if record is not None else index.history(upload_type, filename)
+    finally:
+        if own_index:
+            index.close()
+
+
+class StatusPoller:
+    """
+    Tracks many pending uploads from a single statusRecordPage query per tick.
+
+    Each tracked (fileType, fileName) gets a future that resolves with its status record
+    once it leaves PROCESSING/UPLOADING. The query window starts at the earliest pending
+    submission, and the poll interval backs off while nothing changes. Every record
+    received is kept in the local status index, and uploads it already shows as
+    finished resolve without a query.
+    """
+
+    def __init__(self, cookies, url=STATUS_URL, min_interval=1.0, max_interval=15.0, timeout=300, index=None):
+        self.cookies = cookies
+        self.url = url
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.timeout = timeout
+        self.index = index
+        self.pending = {}
+        self.session = None
+        self._task = None
+        self._own_index = False
 
-    while attempts < max_attempts:
-        status = get_upload_status(url, upload_type, filename, cookies)
-        if not status:
-            logger.warning("No status returned, waiting...")
-            time.sleep(1)
-            attempts += 1
-            continue
+    async def __aenter__(self):
+        headers = {
+            "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/142.0.0.0 Safari/537.36"
+        }
+        if isinstance(self.cookies, CookieJar):
+            self.session = aiohttp.ClientSession(headers=headers, cookie_jar=self.cookies.aiohttp_jar())
+        else:
+            self.session = aiohttp.ClientSession(headers={**headers, "Cookie": self.cookies})
+        if self.index is None:
+            self.index = StatusIndex(STATUS_INDEX_PATH)
+            self._own_index = True
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.close()
+
+    def track(self, upload_type, filename, submitted_at=None):
+        """
+        Starts tracking an upload and returns a future for its final status record.
+
+        Args:
+            upload_type: Upload type the file was submitted as.
+            filename: File name as shown in the status page.
+            submitted_at: Upload time as a datetime, defaults to now.
+        """
+        key = status_key(upload_type, filename)
+        if key not in self.pending:
+            submitted_at = submitted_at or datetime.now()
+            future = asyncio.get_running_loop().create_future()
+            if self.index is not None:
+                known = self.index.latest(upload_type, filename, since=submitted_at)
+                if known is not None and known.get("status", "") not in PENDING_STATUSES:
+                    future.set_result(known)
+                    return future
+            self.pending[key] = {"future": future, "submitted_at": submitted_at, "last": None}
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+        return self.pending[key]["future"]
+
+    async def fetch_records(self):
+        """
+        statusRecordPage queries covering every pending upload, one per upload type.
 
-        current_status = status.get("status", "")
-        if current_status not in ["PROCESSING", "UPLOADING"]:
-            break
+        Every page is read, following the page token. Returns the records, or None if
+        a query failed.
+        """
+        records = []
+        for upload_type in sorted({key[0] for key in self.pending}):
+            earliest = min(p["submitted_at"] for key, p in self.pending.items() if key[0] == upload_type)
+            window_start = int((earliest - timedelta(minutes=5)).timestamp() * 1000)
+            window_end = int((datetime.now() + timedelta(minutes=5)).timestamp() * 1000)
+            type_records, token = [], None
+            for _ in range(MAX_STATUS_PAGES):
+                start = time.monotonic()
+                params = status_params(window_start, window_end, upload_type, token)
+                async with self.session.get(self.url, params=params) as response:
+                    body = await response.read()
+                    METRICS.observe("http_request_seconds", time.monotonic() - start, endpoint="status")
+                    METRICS.inc("http_responses_total", endpoint="status", status=response.status)
+                    METRICS.inc("http_bytes_in_total", len(body), endpoint="status")
+                    if response.status != 200:
+                        logger.warning(f"Status query failed with response {response.status}")
+                        return None
+                    data = await response.json(content_type=None)
+                if not isinstance(data, dict):
+                    raise ValueError(f"Unexpected status response: {type(data).__name__}")
+                type_records.extend(data.get("statusRecordList", []))
+                token = data.get("token")
+                if not token:
+                    break
+            if self.index is not None:
+                self.index.update(type_records, window_start=window_start, upload_type=upload_type, complete=not token)
+            records.extend(type_records)
+        return records
 
-        logger.info(f"File {status.get('fileName', filename)} still processing. Status: {current_status}")
-        time.sleep(2)
-        attempts += 1
+    def _resolve(self, records):
+        """Matches records to pending uploads. Returns True if any upload changed."""
+        latest = {}
+        for record in records:
+            key = status_key(record.get("fileType"), record.get("fileName"))
+            if key not in self.pending:
+                continue
+            # Ignore earlier uploads of the same file, allowing for clock skew
+            uploaded = record.get("uploadedDateTime", 0)
+            if uploaded < (self.pending[key]["submitted_at"] - timedelta(minutes=2)).timestamp() * 1000:
+                continue
+            if uploaded >= latest.get(key, {}).get("uploadedDateTime", 0):
+                latest[key] = record
+
+        changed = False
+        for key, record in latest.items():
+            entry = self.pending[key]
+            if entry["last"] is None or entry["last"].get("status") != record.get("status"):
+                changed = True
+            entry["last"] = record
+            if record.get("status", "") not in PENDING_STATUSES:
+                logger.info(f"File {key[1]} finished. Status: {record.get('status', '')}, Message: {record.get('message', '')}")
+                if not entry["future"].done():
+                    entry["future"].set_result(record)
+                del self.pending[key]
+        return changed
+
+    def _expire(self):
+        """Resolves uploads that have been pending longer than the timeout with their last record."""
+        now = datetime.now()
+        for key, entry in list(self.pending.items()):
+            if (now - entry["submitted_at"]).total_seconds() > self.timeout:
+                logger.warning(f"Gave up waiting for {key[1]}; last status {(entry['last'] or {}).get('status')}")
+                if not entry["future"].done():
+                    entry["future"].set_result(entry["last"] or {})
+                del self.pending[key]
+
+    async def _run(self):
+        """Polls until nothing is pending. Any unexpected error fails every pending future."""
+        try:
+            await self._poll()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Status polling stopped: {e!r}")
+            for entry in self.pending.values():
+                if not entry["future"].done():
+                    entry["future"].set_exception(e)
+            self.pending.clear()
+
+    async def _poll(self):
+        interval = self.min_interval
+        while self.pending:
+            try:
+                records = await self.fetch_records()
+            except (aiohttp.ClientError, asyncio.TimeoutError, ValueError) as e:
+                # ValueError covers a login page or other non-JSON body served with a 200;
+                # the timeout below must keep running either way
+                logger.warning(f"Status query failed: {e!r}")
+                records = None
 
+            if records is not None and self._resolve(records):
+                interval = self.min_interval
+            else:
+                interval = min(self.max_interval, interval * 1.5)
+
+            self._expire()
+            if self.pending:
+                logger.info(f"{len(self.pending)} uploads still processing, next check in {interval:.1f}s")
+                await asyncio.sleep(interval)
+
+    async def close(self):
+        """Stops polling, closes the session and saves any rotated cookies."""
+        if self._task is not None and not self._task.done():
+            self._task.cancel()
+        if self.session is not None:
+            if isinstance(self.cookies, CookieJar):
+                self.cookies.sync_from_aiohttp(self.session.cookie_jar)
+                self.cookies.save()
+            await self.session.close()
+            self.session = None
+        if self._own_index:
+            self.index.close()
+            self.index = None
+            self._own_index = False
+
+
+async def wait_for_statuses(files, cookies, url=STATUS_URL, timeout=300):
+    """
+    Waits for a batch of uploads to finish processing.
+
+    Args:
+        files: List of (upload_type, filename) tuples.
+        cookies: Cookie header string or CookieJar.
+
+    Returns:
+        Status records in the same order as files.
+    """
+    async with StatusPoller(cookies, url=url, timeout=timeout) as poller:
+        futures = [poller.track(upload_type, filename) for upload_type, filename in files]
+        return await asyncio.gather(*futures)
+
+
+def get_processed_status(url, upload_type, filename, cookies, timeout=300):
+    """Queries for status until it's uploaded or processed"""
+    status = asyncio.run(wait_for_statuses([(upload_type, filename)], cookies, url=url, timeout=timeout))[0]
     logger.info(f"File upload status: {status.get('status', '')}, Message: {status.get('message', '')}")
     return status
 
@@ -85,6 +325,6 @@ if __name__ == "__main__":
     url = "https://logistics.amazon.co.uk/internal/capacity/api/statusRecordPage"
     cc = Cookies(url)
 
-    status = get_upload_status(STATUS_URL, "Exclusive Offer Allocation", "file_number_1", cc.main())
+    status = get_upload_status(STATUS_URL, "Exclusive Offer Allocation", "file_number_1", cc.get_jar())
 
     print(status)
\ No newline at end of file
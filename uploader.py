@@ -1,32 +1,189 @@
-from selenium import webdriver
-from selenium.webdriver.common.by import By
-from selenium.webdriver.support.ui import WebDriverWait
-from selenium.webdriver.support import expected_conditions as EC
-from selenium.webdriver.support.ui import Select
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
+import queue
 import time
 import logging
 import os
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import NewConnectionError
 
 from config import *
-from cookie_scrape import Cookies
-from upload_status import get_processed_status
+from cookie_scrape import Cookies, CookieJar
+from upload_status import wait_for_statuses
+from metrics import METRICS
 
 logger = logging.getLogger(__name__)
 
+# Shown by the uploader once a file has been accepted
+UPLOAD_SUCCESS_TEXT = "Processor has been notified successfully."
+
+
+def upload_acknowledged(response):
+    """
+    True if an upload response positively confirms the file was accepted.
+
+    A 200 alone is not enough: an unknown route or an expired session can answer with
+    an HTML page. The body must carry the uploader's success message, or be JSON that
+    does not report an error.
+    """
+    if not response.ok:
+        return False
+    if UPLOAD_SUCCESS_TEXT in response.text:
+        return True
+    if "json" not in response.headers.get("Content-Type", ""):
+        return False
+    try:
+        body = response.json()
+    except ValueError:
+        return False
+    if not isinstance(body, dict):
+        return False
+    return body.get("success", True) is not False and not body.get("error") and not body.get("errorMessage")
+
+
+def connection_made(error):
+    """
+    False if a request failed before a connection to the server was established,
+    e.g. connection refused, DNS failure or connect timeout. True if it may have been sent.
+    """
+    if isinstance(error, requests.exceptions.ConnectTimeout):
+        return False
+    if not isinstance(error, requests.exceptions.ConnectionError) or not error.args:
+        return True
+    reason = getattr(error.args[0], "reason", error.args[0])
+    return not isinstance(reason, NewConnectionError)
+
+
+class HttpUploader:
+    """
+    Browserless upload path.
+
+    Sends the same request the uploader form does (file type plus file content) over a
+    pooled requests session, so no Chrome process is needed. The endpoint and field
+    names are inferred from the form, so a file only counts as uploaded once the
+    response acknowledges it.
+    """
+
+    def __init__(self, cookies, url=UPLOAD_API_URL, pool_size=8):
+        self.url = url
+        self.cookies = cookies
+        self.session = requests.Session()
+        self.session.mount("https://", HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size))
+        self.session.headers.update({
+            "Referer": CAPACITY_UPLOADER_URL,
+            "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/142.0.0.0 Safari/537.36"
+        })
+        if isinstance(cookies, CookieJar):
+            self.session.cookies = cookies.requests_jar()
+        else:
+            self.session.headers["Cookie"] = cookies
+
+    def upload_file(self, upload_type, file_path):
+        """Posts a single file. Returns True if the server acknowledged it."""
+        return self.send(upload_type, file_path)[0]
+
+    def send(self, upload_type, file_path):
+        """
+        Posts a single file. Returns (acknowledged, reached).
+
+        reached is False only if the server provably did not receive the file: the
+        connection was never established or the endpoint does not exist (404). Any other
+        failure may have been processed, so it must not be resubmitted another way.
+        """
+        if not os.path.exists(file_path):
+            logger.error(f"File does not exist: {file_path}")
+            return False, True
+
+        start = time.monotonic()
+        try:
+            with open(file_path, "rb") as f:
+                response = self.session.post(
+                    self.url,
+                    data={"fileType": upload_type},
+                    files={"file": (os.path.basename(file_path), f, "text/csv")},
+                    timeout=60
+                )
+        except requests.RequestException as e:
+            logger.error(f"HTTP upload of {file_path} failed: {e}")
+            METRICS.inc("http_errors_total", endpoint="upload")
+            return False, connection_made(e)
+
+        METRICS.observe("http_request_seconds", time.monotonic() - start, endpoint="upload")
+        METRICS.inc("http_responses_total", endpoint="upload", status=response.status_code)
+        METRICS.inc("http_bytes_out_total", os.path.getsize(file_path), endpoint="upload")
+        if upload_acknowledged(response):
+            logger.info(f"Response {response.status_code}. File uploaded: {file_path}")
+            return True, True
+
+        logger.error(f"Response {response.status_code}. HTTP upload of {file_path} was not acknowledged")
+        logger.error(f"Response preview: {response.text[:50]}")
+        return False, response.status_code != 404
+
+    def upload_batch(self, files_list, workers=UPLOAD_WORKERS):
+        """
+        Posts files over parallel connections. Results come back in submission order.
+
+        Ordered upload types share one lane and are still posted one after another.
+        Each result also says whether the file reached the server (see send).
+        """
+        results = [None] * len(files_list)
+
+        def run_lane(lane):
+            for idx, upload_type, file_path in lane:
+                success, reached = self.send(upload_type, file_path)
+                results[idx] = {"file": file_path, "success": success, "reached": reached}
+
+        with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+            for future in [executor.submit(run_lane, lane) for lane in BrowserPool.lanes(files_list)]:
+                try:
+                    future.result()
+                except Exception as e:
+                    logger.error(f"Upload lane failed: {e}")
+
+        return [
+            result or {"file": file_path, "success": False, "reached": True}
+            for result, (_, file_path) in zip(results, files_list)
+        ]
+
+    def close(self):
+        """Closes the session and saves any rotated cookies."""
+        if isinstance(self.cookies, CookieJar):
+            self.cookies.sync_from_requests(self.session.cookies)
+            self.cookies.save()
+        self.session.close()
+
+
 class FileUploader:
     def __init__(self):
         self.driver = None
+        self.http = None
         self.url = CAPACITY_UPLOADER_URL
         self.base_url = BASE_URL
         self.cookies_handler = None
         self.cookies_string = None
 
-    def setup_driver(self, cookies_list, cookies_string, cookies_handler=None):
+    def setup_http(self, cookie_jar, cookies_handler=None):
+        """Enables the browserless upload path. Chrome is only started if a fallback is needed."""
+        self.http = HttpUploader(cookie_jar)
+        self.cookies_handler = cookies_handler
+        self.cookies_string = cookie_jar
+        return True
+
+    def setup_driver(self, cookies_list, cookies_string, cookies_handler=None, headless=False):
         """Initialize Chrome driver and load cookies."""
+        # Selenium is only imported once a browser is really needed
+        from selenium import webdriver
+        from selenium.webdriver.chrome.options import Options
+
         logger.info("Setting up Chrome driver...")
-        self.driver = webdriver.Chrome()
+        options = Options()
+        if headless:
+            options.add_argument("--headless=new")
+            options.add_argument("--window-size=1920,1080")
+        self.driver = webdriver.Chrome(options=options)
         self.cookies_handler = cookies_handler
-        self.cookies_string = cookies_string  # Store for API requests
+        self.cookies_string = cookies_string  # Header string or CookieJar, stored for API requests
 
         # First navigate to base domain to set cookies
         logger.info("Navigating to base domain...")
@@ -78,7 +235,39 @@ class FileUploader:
     def upload_file(self, upload_type, file_path):
         """
         Upload a single file to the capacity uploader.
+
+        Uses the HTTP path when it is set up and falls back to the browser form only if
+        the direct upload never reached the server, so a file is not submitted twice.
+        """
+        if self.http is not None:
+            if not os.path.exists(file_path):
+                logger.error(f"File does not exist: {file_path}")
+                return False
+            success, reached = self.http.send(upload_type, file_path)
+            if success or reached:
+                return success
+
+            logger.warning(f"Falling back to browser upload for {file_path}")
+            if self.driver is None:
+                cookies = self.cookies_string
+                cookies_list = cookies.as_list() if isinstance(cookies, CookieJar) else []
+                if not self.setup_driver(cookies_list, cookies, cookies_handler=self.cookies_handler):
+                    return False
+
+        start = time.monotonic()
+        success = self.upload_file_browser(upload_type, file_path)
+        METRICS.observe("browser_upload_seconds", time.monotonic() - start)
+        METRICS.inc("browser_uploads_total", success=success)
+        return success
+
+    def upload_file_browser(self, upload_type, file_path):
         """
+        Upload a single file through the uploader form in Chrome.
+        """
+        from selenium.webdriver.common.by import By
+        from selenium.webdriver.support.ui import WebDriverWait
+        from selenium.webdriver.support import expected_conditions as EC
+
         try:
             logger.info(f"Uploading file: {file_path}")
 
@@ -153,22 +342,11 @@ class FileUploader:
                 success_msg = WebDriverWait(self.driver, 30).until(
                     EC.presence_of_element_located((
                         By.XPATH,
-                        "//*[contains(text(), 'Processor has been notified successfully.')]"
+                        f"//*[contains(text(), '{UPLOAD_SUCCESS_TEXT}')]"
                     ))
                 )
                 logger.info(f"Upload successful: {success_msg.text}")
                 logger.info(f"File uploaded: {file_path}")
-
-                # Verify upload status using pre-generated cookie string
-                if self.cookies_string:
-                    status = get_processed_status(
-                            url=STATUS_URL,
-                            upload_type=upload_type,
-                            filename=file_path.split("\\")[-1],
-                            cookies=self.cookies_string
-                        )
-                    logger.info(f"File upload status: {status.get('status', '')}, Message: {status.get('message', '')}")
-
                 return True
 
             except Exception as e:
@@ -190,8 +368,8 @@ class FileUploader:
             success = self.upload_file(upload_type, file_path)
             results.append({"file": file_path, "success": success})
 
-            # Reload page between uploads
-            if idx < len(files_list):
+            # Reload page between browser uploads
+            if self.driver and idx < len(files_list):
                 logger.info("Refreshing page for next upload...")
                 self.driver.get(self.url)
                 time.sleep(3)
@@ -199,49 +377,204 @@ class FileUploader:
         return results
 
     def close(self):
-        """Close the browser."""
+        """Close the HTTP session and the browser."""
+        if self.http:
+            self.http.close()
         if self.driver:
             logger.info("Closing browser...")
             time.sleep(1)
             self.driver.quit()
 
 
-if __name__ == "__main__":
+class BrowserPool:
+    """
+    Pool of warm headless browser workers for parallel uploads.
+
+    Each worker is a FileUploader whose driver is started and given the cookies once.
+    Files of ORDERED_UPLOAD_TYPES are chained on a single worker in submission order,
+    since the backend processes them in sequence; every other file is dispatched to
+    whichever worker is free.
+    """
+
+    def __init__(self, size=UPLOAD_WORKERS, headless=True):
+        self.size = size
+        self.headless = headless
+        self.workers = []
+        self.idle = queue.Queue()
+
+    def start(self, cookies_list, cookies, cookies_handler=None):
+        """Starts all workers in parallel. Returns False if none could be set up."""
+        def start_worker(_):
+            worker = FileUploader()
+            try:
+                ok = worker.setup_driver(cookies_list, cookies, cookies_handler=cookies_handler, headless=self.headless)
+            except Exception as e:
+                logger.error(f"Failed to start browser worker: {e}")
+                ok = False
+            if not ok:
+                worker.close()
+                return None
+            return worker
+
+        with ThreadPoolExecutor(max_workers=self.size) as executor:
+            self.workers = [w for w in executor.map(start_worker, range(self.size)) if w is not None]
+        for worker in self.workers:
+            self.idle.put(worker)
+
+        logger.info(f"Started {len(self.workers)}/{self.size} browser workers")
+        return bool(self.workers)
+
+    @staticmethod
+    def lanes(files_list):
+        """
+        Groups indexed files into lanes that must each run sequentially.
+
+        Returns a list of [(index, upload_type, file_path), ...] in order of first submission.
+        """
+        lanes, ordered = [], {}
+        for idx, (upload_type, file_path) in enumerate(files_list):
+            if upload_type in ORDERED_UPLOAD_TYPES:
+                if upload_type not in ordered:
+                    ordered[upload_type] = []
+                    lanes.append(ordered[upload_type])
+                ordered[upload_type].append((idx, upload_type, file_path))
+            else:
+                lanes.append([(idx, upload_type, file_path)])
+        return lanes
+
+    def _run_lane(self, lane, results):
+        worker = self.idle.get()
+        try:
+            for idx, upload_type, file_path in lane:
+                logger.info(f"Processing file {idx + 1}: {file_path}")
+                results[idx] = {"file": file_path, "success": worker.upload_file(upload_type, file_path)}
+                # Leave the worker on a fresh upload page for the next file
+                worker.driver.get(worker.url)
+        finally:
+            self.idle.put(worker)
+
+    def upload_batch(self, files_list):
+        """Uploads files across the workers. Results come back in submission order."""
+        results = [None] * len(files_list)
+        with ThreadPoolExecutor(max_workers=len(self.workers)) as executor:
+            futures = [executor.submit(self._run_lane, lane, results) for lane in self.lanes(files_list)]
+            for future in futures:
+                try:
+                    future.result()
+                except Exception as e:
+                    logger.error(f"Upload lane failed: {e}")
+
+        return [
+            result or {"file": file_path, "success": False}
+            for result, (_, file_path) in zip(results, files_list)
+        ]
+
+    def close(self):
+        """Closes every worker's browser."""
+        for worker in self.workers:
+            worker.close()
+        self.workers = []
+
+
+def verify_uploads(files_list, results, cookies, timeout=300):
+    """
+    Waits for every accepted upload to finish processing on one status poller and
+    adds its final status record to the result under "status".
+    """
+    accepted = [
+        (upload_type, os.path.basename(file_path))
+        for (upload_type, file_path), result in zip(files_list, results) if result["success"]
+    ]
+    records = iter(asyncio.run(wait_for_statuses(accepted, cookies, timeout=timeout)) if accepted else [])
+    for result in results:
+        result["status"] = next(records) if result["success"] else None
+        if result["status"]:
+            logger.info(f"{os.path.basename(result['file'])} status: {result['status'].get('status', '')}, "
+                        f"Message: {result['status'].get('message', '')}")
+    return results
+
+
+def upload_http(files_to_upload, cookie_jar, uploader, cookies_handler=None):
+    """
+    Posts files over parallel HTTP connections.
+
+    Files that never reached the server are retried through the browser form on
+    uploader; every other failure is reported as is, so nothing is submitted twice.
+    """
+    http = HttpUploader(cookie_jar, pool_size=max(8, UPLOAD_WORKERS))
+    try:
+        results = http.upload_batch(files_to_upload, workers=UPLOAD_WORKERS)
+    finally:
+        http.close()
+
+    unreached = [idx for idx, result in enumerate(results) if not result.pop("reached")]
+    if not unreached:
+        return results
+
+    logger.warning(f"Falling back to browser upload for {len(unreached)} file(s)")
+    if not uploader.setup_driver(cookie_jar.as_list(), cookie_jar, cookies_handler=cookies_handler):
+        logger.error("Failed to setup driver.")
+        return results
+    for idx, result in zip(unreached, uploader.upload_batch([files_to_upload[idx] for idx in unreached])):
+        results[idx] = result
+    return results
+
+
+def upload_files(files_to_upload, mode=UPLOAD_MODE, verify=True, timeout=300):
+    """
+    Uploads (upload_type, file_path) pairs with the given mode and returns the results.
+
+    Cookies are loaded and validated once and shared by whichever upload path is used.
+    All files are uploaded first; with verify, their processing is then awaited together.
+    """
     uploader = FileUploader()
+    pool = BrowserPool() if mode == "pool" else None
     cc = Cookies(CAPACITY_UPLOADER_URL)
 
     try:
-        # Get the cookies in both formats (only once)
-        cookies_list = cc.main(as_string=False)
-        cookies_string = cc.main(as_string=True)
-
-        # Setup driver and load cookies
-        if not uploader.setup_driver(cookies_list, cookies_string, cookies_handler=cc):
-            logger.error("Failed to setup driver. Exiting...")
-            exit(1)
-
-        # Example: Upload single file
-        # uploader.upload_file("Exclusive Offer Allocation", r"C:\path\to\your\file.csv")
-
-        # Example: Upload multiple files (list of tuples to support duplicate upload types)
-        files_to_upload = [
-            ("Exclusive Offer Allocation",  r"C:\Users\jklas\Downloads\file_number_1.csv"),
-            ("Amzl_Dph_Override",           r"C:\Users\jklas\Downloads\file_number_2.csv"),
-            ("Amzl_Volume_Override",        r"C:\Users\jklas\Downloads\file_number_3.csv"),
-            ("Demand",                      r"C:\Users\jklas\Downloads\file_number_4.csv"),
-            ("Demand",                      r"C:\Users\jklas\Downloads\file_number_5.csv")
-        ]
-
-        results = uploader.upload_batch(files_to_upload)
+        # Load and validate the shared cookie jar once; it serves both the list and API forms
+        cookie_jar = cc.get_jar()
+
+        # Upload over HTTP where possible, otherwise setup driver and load cookies
+        if mode == "http":
+            results = upload_http(files_to_upload, cookie_jar, uploader, cookies_handler=cc)
+        elif pool is not None:
+            if not pool.start(cookie_jar.as_list(), cookie_jar, cookies_handler=cc):
+                logger.error("Failed to start browser workers.")
+                return [{"file": file_path, "success": False} for _, file_path in files_to_upload]
+        elif not uploader.setup_driver(cookie_jar.as_list(), cookie_jar, cookies_handler=cc):
+            logger.error("Failed to setup driver.")
+            return [{"file": file_path, "success": False} for _, file_path in files_to_upload]
+
+        if pool is not None:
+            results = pool.upload_batch(files_to_upload)
+        elif mode != "http":
+            results = uploader.upload_batch(files_to_upload)
+        if verify:
+            verify_uploads(files_to_upload, results, cookie_jar, timeout=timeout)
 
         # Print results
         for result in results:
             status = "✓" if result["success"] else "✗"
             logger.info(f"{status} {result['file']}")
-
-        # For now, just pause to see the page
-        logger.info("Browser ready. Waiting 10 seconds before closing...")
-        time.sleep(10)
+        return results
 
     finally:
-        uploader.close()
\ No newline at end of file
+        uploader.close()
+        if pool is not None:
+            pool.close()
+
+
+if __name__ == "__main__":
+    # Example: Upload multiple files (list of tuples to support duplicate upload types)
+    files_to_upload = [
+        ("Exclusive Offer Allocation",  r"C:\Users\jklas\Downloads\file_number_1.csv"),
+        ("Amzl_Dph_Override",           r"C:\Users\jklas\Downloads\file_number_2.csv"),
+        ("Amzl_Volume_Override",        r"C:\Users\jklas\Downloads\file_number_3.csv"),
+        ("Demand",                      r"C:\Users\jklas\Downloads\file_number_4.csv"),
+        ("Demand",                      r"C:\Users\jklas\Downloads\file_number_5.csv")
+    ]
+
+    results = upload_files(files_to_upload)
+    if not any(result["success"] for result in results):
+        exit(1)
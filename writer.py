@@ -0,0 +1,105 @@
+import os
+import logging
+from datetime import date
+
+import pyarrow.compute as pc
+import pyarrow.csv as pacsv
+import pyarrow.parquet as pq
+
+from normalize import normalize, decode_dictionaries, DEMAND_SCHEMA
+
+logger = logging.getLogger(__name__)
+
+
+class DemandWriter:
+    """
+    Streams scraped demand records to a CSV or Parquet file, one site at a time.
+
+    With a HistoryStore attached, every batch is also appended to the run history;
+    path may then be None to write the history only.
+    """
+
+    def __init__(self, path, capacity_type="CSP", fields=None, history=None):
+        self.path = path
+        self.capacity_type = capacity_type
+        self.fields = fields
+        self.history = history
+        self.format = "parquet" if path and path.lower().endswith(".parquet") else "csv"
+        self.rows = 0
+        self._writer = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def write(self, site, payload, history=True):
+        """
+        Normalizes, filters and appends a single site's response. Returns rows written.
+
+        history=False leaves this batch out of the history. Dates of the payload left
+        without rows, e.g. because all their blocks were withdrawn, are recorded in the
+        history as empty, so snapshots stop serving their older rows.
+        """
+        table = normalize(site, payload, self.capacity_type, self.fields)
+        if self.history is not None and history:
+            empty = sorted(set(payload) - set(table["date"].to_pylist()))
+            if empty:
+                self.history.remove([
+                    {"station": str(site.get("station")), "area_id": str(site.get("area_id")), "date": date}
+                    for date in empty
+                ])
+        return self.write_table(table, history)
+
+    def write_table(self, table, history=True):
+        """Appends an already normalized table. Returns rows written."""
+        if not table.num_rows:
+            return 0
+
+        if self.history is not None and history:
+            self.history.append(table)
+        if self.path is None:
+            self.rows += table.num_rows
+            return table.num_rows
+
+        if self.format == "csv":
+            # CSV has no categorical type; write the plain values
+            table = decode_dictionaries(table)
+
+        if self._writer is None:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            if self.format == "parquet":
+                self._writer = pq.ParquetWriter(self.path, table.schema)
+            else:
+                self._writer = pacsv.CSVWriter(self.path, table.schema)
+
+        self._writer.write_table(table)
+        self.rows += table.num_rows
+        return table.num_rows
+
+    def close(self):
+        """Flushes and closes the underlying file, and writes the run to the history."""
+        if self.history is not None:
+            self.history.flush()
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+            logger.info(f"Wrote {self.rows} rows to {self.path}")
+
+
+def write_latest(history, path, stations=None, lookback_days=7):
+    """
+    Writes the newest snapshot of every current slice in the history to path.
+
+    Used when a run only fetched part of the forecast (a refresh schedule or delta
+    scraping), so the output still covers every slice. Only the last lookback_days
+    of history are read: anything older was scraped for dates that have passed.
+    Returns rows written.
+    """
+    table = history.latest(stations=stations, columns=DEMAND_SCHEMA.names + ["run_ts"], lookback_days=lookback_days)
+    if not table.num_rows:
+        return 0
+    table = table.filter(pc.greater_equal(table["date"], date.today().isoformat()))
+    with DemandWriter(path, capacity_type="CSP") as out:
+        return out.write_table(table)